@@ -36,6 +36,18 @@ CREATE INDEX IF NOT EXISTS idx_sessions_session_id ON sessions(session_id);
 CREATE INDEX IF NOT EXISTS idx_sessions_user_id ON sessions(user_id);
 CREATE INDEX IF NOT EXISTS idx_sessions_status ON sessions(status);
 CREATE INDEX IF NOT EXISTS idx_sessions_start_time ON sessions(start_time DESC);
+-- Keyset pagination of /api/sessions orders by (start_time, session_id)
+CREATE INDEX IF NOT EXISTS idx_sessions_start_time_id ON sessions(start_time DESC, session_id DESC);
+
+-- Session length in whole seconds, computed by Postgres once end_time is set
+ALTER TABLE sessions
+    ADD COLUMN IF NOT EXISTS duration_seconds INTEGER
+    GENERATED ALWAYS AS (EXTRACT(EPOCH FROM (end_time - start_time))::INTEGER) STORED;
+
+-- Older versions of the app stored topics/metrics as JSON-encoded strings
+-- inside these JSONB columns; unwrap them into real arrays/objects
+UPDATE sessions SET topics = (topics #>> '{}')::jsonb WHERE jsonb_typeof(topics) = 'string';
+UPDATE sessions SET metrics = (metrics #>> '{}')::jsonb WHERE jsonb_typeof(metrics) = 'string';
 
 -- ============================================
 -- 2. SESSION_LOGS TABLE
@@ -51,10 +63,24 @@ CREATE TABLE IF NOT EXISTS session_logs (
 );
 
 -- Create indexes for faster queries
-CREATE INDEX IF NOT EXISTS idx_session_logs_session_id ON session_logs(session_id);
+-- (session_id, id) serves both per-session lookups and the per-session
+-- ORDER BY id reads (history, transcripts) straight from the index
+DROP INDEX IF EXISTS idx_session_logs_session_id;
+CREATE INDEX IF NOT EXISTS idx_session_logs_session_id_id ON session_logs(session_id, id);
 CREATE INDEX IF NOT EXISTS idx_session_logs_created_at ON session_logs(created_at DESC);
 CREATE INDEX IF NOT EXISTS idx_session_logs_event_type ON session_logs(event_type);
 
+-- Full-text search vector, maintained by Postgres on every insert/update
+ALTER TABLE session_logs
+    ADD COLUMN IF NOT EXISTS message_tsv TSVECTOR
+    GENERATED ALWAYS AS (to_tsvector('english', message)) STORED;
+CREATE INDEX IF NOT EXISTS idx_session_logs_message_tsv ON session_logs USING GIN (message_tsv);
+
+-- Trigram index so case-insensitive substring search (ILIKE '%kw%') is
+-- index-backed instead of scanning every message
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS idx_session_logs_message_trgm ON session_logs USING GIN (message gin_trgm_ops);
+
 -- ============================================
 -- 3. AUTOMATIC UPDATED_AT TRIGGER
 -- ============================================
@@ -74,7 +100,114 @@ CREATE TRIGGER update_sessions_updated_at
     EXECUTE FUNCTION update_updated_at_column();
 
 -- ============================================
--- 4. ROW LEVEL SECURITY (RLS) - OPTIONAL
+-- 4. RPC FUNCTIONS
+-- ============================================
+-- Called from the app via supabase.rpc(...) so aggregation runs in Postgres
+
+-- Message counts for a session (used by the get_session_stats tool)
+CREATE OR REPLACE FUNCTION get_session_stats_rpc(sid UUID)
+RETURNS JSON AS $$
+    SELECT json_build_object(
+        'total_messages', COUNT(*),
+        'user_messages', COUNT(*) FILTER (WHERE event_type = 'user'),
+        'ai_messages', COUNT(*) FILTER (WHERE event_type = 'ai')
+    )
+    FROM session_logs
+    WHERE session_id = sid;
+$$ LANGUAGE sql STABLE;
+
+-- Full-text search over a session's messages (used by the search_chat_history tool).
+-- Returns the total match count and the top matches ranked by relevance.
+CREATE OR REPLACE FUNCTION search_session_logs(sid UUID, keyword TEXT, max_results INTEGER DEFAULT 5)
+RETURNS JSON AS $$
+    WITH matches AS (
+        SELECT id, event_type, message, ts_rank_cd(message_tsv, query) AS rank
+        FROM session_logs, websearch_to_tsquery('english', keyword) AS query
+        WHERE session_id = sid AND message_tsv @@ query
+    ),
+    top_matches AS (
+        SELECT * FROM matches ORDER BY rank DESC, id LIMIT max_results
+    )
+    SELECT json_build_object(
+        'matches', (SELECT COUNT(*) FROM matches),
+        'messages', COALESCE(
+            (SELECT json_agg(json_build_object('type', event_type, 'message', message, 'id', id)
+                             ORDER BY rank DESC, id)
+             FROM top_matches),
+            '[]'::json
+        )
+    );
+$$ LANGUAGE sql STABLE;
+
+-- Transcript and message metrics for a session (used by generate_session_summary).
+-- Joins the messages into "User: ..." / "AI: ..." lines in conversation order.
+CREATE OR REPLACE FUNCTION get_session_transcript(sid UUID)
+RETURNS JSON AS $$
+    WITH logs AS (
+        SELECT id, event_type, message,
+               (SELECT COUNT(*) FROM regexp_matches(message, '\S+', 'g')) AS words
+        FROM session_logs
+        WHERE session_id = sid
+    )
+    SELECT json_build_object(
+        'transcript', COALESCE(
+            string_agg(CASE event_type WHEN 'user' THEN 'User: ' ELSE 'AI: ' END || message, E'\n' ORDER BY id)
+                FILTER (WHERE event_type IN ('user', 'ai')),
+            ''
+        ),
+        'total_messages', COUNT(*),
+        'last_id', MAX(id),
+        'user_messages', COUNT(*) FILTER (WHERE event_type = 'user'),
+        'ai_messages', COUNT(*) FILTER (WHERE event_type = 'ai'),
+        'user_words', COALESCE(SUM(words) FILTER (WHERE event_type = 'user'), 0),
+        'ai_words', COALESCE(SUM(words) FILTER (WHERE event_type = 'ai'), 0)
+    )
+    FROM logs;
+$$ LANGUAGE sql STABLE;
+
+-- Schema diagnostics for tests/check_database.py, in one call: which tables
+-- exist, whether they hold any rows, and whether a session row can be inserted.
+-- EXISTS probes stop at the first row instead of counting whole tables. The test
+-- insert is rolled back by raising inside its block, so nothing is written.
+CREATE OR REPLACE FUNCTION diagnose_schema()
+RETURNS JSON AS $$
+DECLARE
+    sessions_ok BOOLEAN := to_regclass('public.sessions') IS NOT NULL;
+    session_logs_ok BOOLEAN := to_regclass('public.session_logs') IS NOT NULL;
+    sessions_has_rows BOOLEAN;
+    session_logs_has_rows BOOLEAN;
+    insert_ok BOOLEAN := FALSE;
+    errors TEXT[] := '{}';
+BEGIN
+    IF sessions_ok THEN
+        EXECUTE 'SELECT EXISTS (SELECT 1 FROM sessions LIMIT 1)' INTO sessions_has_rows;
+    END IF;
+    IF session_logs_ok THEN
+        EXECUTE 'SELECT EXISTS (SELECT 1 FROM session_logs LIMIT 1)' INTO session_logs_has_rows;
+    END IF;
+
+    BEGIN
+        INSERT INTO sessions (session_id, user_id, status, start_time)
+        VALUES (gen_random_uuid(), 'test_user', 'active', NOW());
+        RAISE EXCEPTION 'rollback test insert' USING ERRCODE = 'DS001';
+    EXCEPTION
+        WHEN SQLSTATE 'DS001' THEN insert_ok := TRUE;
+        WHEN OTHERS THEN errors := errors || SQLERRM;
+    END;
+
+    RETURN json_build_object(
+        'sessions_ok', sessions_ok,
+        'sessions_has_rows', sessions_has_rows,
+        'session_logs_ok', session_logs_ok,
+        'session_logs_has_rows', session_logs_has_rows,
+        'insert_ok', insert_ok,
+        'errors', errors
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================
+-- 5. ROW LEVEL SECURITY (RLS) - OPTIONAL
 -- ============================================
 -- Enable RLS if you want user-level access control
 -- Uncomment these lines if you want to enable RLS
@@ -112,7 +245,7 @@ CREATE TRIGGER update_sessions_updated_at
 --     ));
 
 -- ============================================
--- 5. SAMPLE DATA (OPTIONAL FOR TESTING)
+-- 6. SAMPLE DATA (OPTIONAL FOR TESTING)
 -- ============================================
 -- Insert a test session (uncomment to use)
 -- INSERT INTO sessions (session_id, user_id, status)
@@ -120,7 +253,7 @@ CREATE TRIGGER update_sessions_updated_at
 -- ON CONFLICT (session_id) DO NOTHING;
 
 -- ============================================
--- 6. VERIFY SCHEMA
+-- 7. VERIFY SCHEMA
 -- ============================================
 -- Run these queries to verify your tables were created correctly
 
@@ -1,28 +1,223 @@
 from dotenv import load_dotenv
+import asyncio
+import gzip
+import hashlib
+import io
+import logging
 import os
 import re
+import time
+import uuid
 load_dotenv()
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse
-from supabase import create_client, Client
-from langchain_groq import ChatGroq
-from datetime import datetime
-import json
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import HTMLResponse, ORJSONResponse, Response
+from supabase import create_client, Client, ClientOptions
+from collections import deque
+from contextlib import aclosing, asynccontextmanager
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from functools import lru_cache
+from html import escape as escape_html
+import orjson
+
+UTC = timezone.utc
+
+# LOG_LEVEL=WARNING silences the per-message debug/info lines in production;
+# tracebacks of handled errors are only attached at DEBUG
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
+logger = logging.getLogger(__name__)
 
 supabase_url = os.getenv("SUPABASE_URL")
 supabase_key = os.getenv("SUPABASE_KEY")
-supabase = create_client(supabase_url, supabase_key)
 
+# Upper bound for a single PostgREST request, so a stalled connection fails
+# the query instead of holding a worker thread indefinitely
+SUPABASE_TIMEOUT_SECONDS = 10
 
-app = FastAPI()
 
-model = ChatGroq(
-    model="meta-llama/llama-4-scout-17b-16e-instruct",
-    temperature=0,
-    max_tokens=None,
-    max_retries=2
-)
+@lru_cache(maxsize=1)
+def get_supabase() -> Client:
+    """
+    Create the Supabase client once and hand out the same instance afterwards.
+    The client keeps its PostgREST session (and that session's connection pool)
+    for its whole lifetime, so sharing one instance reuses open connections
+    instead of paying connect/TLS setup again.
+    """
+    return create_client(
+        supabase_url,
+        supabase_key,
+        options=ClientOptions(postgrest_client_timeout=SUPABASE_TIMEOUT_SECONDS),
+    )
+
+
+supabase = get_supabase()
+
+
+async def run_query(query):
+    """
+    Execute a Supabase query builder without blocking the event loop.
+    The supabase-py client is synchronous, so .execute() runs in a worker
+    thread and other WebSocket connections keep being served meanwhile.
+    """
+    return await asyncio.to_thread(query.execute)
+
+
+# On shutdown, finalizations still running get this long to finish
+SHUTDOWN_FINALIZE_TIMEOUT_SECONDS = 30
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Run the background session log writer for the lifetime of the app. On
+    shutdown, let running finalizations finish first, then flush whatever
+    the writer still holds.
+    """
+    stop = asyncio.Event()
+    writer = asyncio.create_task(run_log_writer(stop))
+    try:
+        yield
+    finally:
+        pending = _finalize_tasks | _summary_tasks
+        if pending:
+            logger.info("[SHUTDOWN] Waiting for %d session finalizations...", len(pending))
+            _, still_running = await asyncio.wait(pending, timeout=SHUTDOWN_FINALIZE_TIMEOUT_SECONDS)
+            if still_running:
+                logger.warning("[SHUTDOWN] %d finalizations did not finish in time", len(still_running))
+        stop.set()
+        await writer
+
+
+# JSON responses are serialized with orjson
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+# Compress text responses (summary page, JSON APIs) above 1 KB
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+@lru_cache(maxsize=1)
+def get_model():
+    """
+    Create the Groq chat model on first use. langchain_groq pulls in a large
+    part of LangChain, so importing it lazily keeps server startup fast.
+    """
+    from langchain_groq import ChatGroq
+    
+    return ChatGroq(
+        model="meta-llama/llama-4-scout-17b-16e-instruct",
+        temperature=0,
+        max_tokens=None,
+        max_retries=2
+    )
+
+
+# Streamed tokens are forwarded to the browser at most this often
+STREAM_FLUSH_SECONDS = 0.02
+
+
+async def coalesce_tokens(chunks, interval: float = STREAM_FLUSH_SECONDS):
+    """
+    Merge streamed model chunks into larger text pieces. The first token is
+    yielded right away; after that, tokens are buffered and sent together at
+    most `interval` seconds apart. If the model stalls, whatever is buffered
+    is sent once `interval` has passed rather than waiting for the next token.
+    """
+    loop = asyncio.get_running_loop()
+    iterator = chunks.__aiter__()
+    buffer = []
+    next_flush = 0.0
+    pending = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            # Only wait with a deadline while there is something to send
+            timeout = max(0.0, next_flush - loop.time()) if buffer else None
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+            if not done:
+                # No new token in time: flush, keep waiting for the same chunk
+                yield "".join(buffer)
+                buffer.clear()
+                next_flush = loop.time() + interval
+                continue
+            task, pending = pending, None
+            try:
+                chunk = task.result()
+            except StopAsyncIteration:
+                break
+            token = getattr(chunk, 'content', None)
+            if not token:
+                continue
+            buffer.append(token)
+            now = loop.time()
+            if now >= next_flush:
+                yield "".join(buffer)
+                buffer.clear()
+                next_flush = now + interval
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        # Stop the upstream stream (and its HTTP response) when the consumer
+        # gives up early; a running __anext__ has to end before aclose()
+        if pending is not None:
+            pending.cancel()
+            try:
+                await pending
+            except BaseException:
+                pass
+        aclose = getattr(iterator, 'aclose', None)
+        if aclose is not None:
+            await aclose()
+
+
+# Conversation memory sent with each prompt: at most this many previous
+# messages, newest first, until the rough token estimate reaches the budget
+HISTORY_MAX_MESSAGES = 20
+HISTORY_TOKEN_BUDGET = 2048
+HISTORY_ROLES = {'user': 'human', 'ai': 'assistant'}
+
+
+def history_messages(history) -> list:
+    """
+    Pick the most recent (role, text) messages from `history` (in
+    chronological order) that fit HISTORY_TOKEN_BUDGET, oldest first.
+    Tokens are estimated as len(text) // 4.
+    """
+    messages = []
+    budget = HISTORY_TOKEN_BUDGET
+    for role, message in reversed(history):
+        budget -= len(message) // 4
+        if budget < 0:
+            break
+        messages.append((role, message))
+    messages.reverse()
+    return messages
+
+
+async def load_history(session_id: str) -> deque:
+    """
+    Load the latest HISTORY_MAX_MESSAGES messages of a session as a
+    (role, text) ring buffer. Only needed when a session is reopened; after
+    that the WebSocket handler keeps the buffer up to date itself.
+    """
+    # Messages of a connection that just closed may still be buffered
+    await flush_logs()
+    logs = await run_query(
+        supabase.from_("session_logs")
+        .select("event_type,message")
+        .eq("session_id", session_id)
+        .order("id", desc=True)
+        .limit(HISTORY_MAX_MESSAGES)
+    )
+    history = deque(maxlen=HISTORY_MAX_MESSAGES)
+    for log in reversed(logs.data or []):
+        role = HISTORY_ROLES.get(log['event_type'])
+        if role:
+            history.append((role, log['message'] or ''))
+    return history
 
 # ============================================================
 # TOOL DEFINITIONS - These are functions the AI can call
@@ -103,10 +298,232 @@ TUTORIAL_PROMPT = """You are a patient teacher and tutor. When responding:
 # System prompt to ensure proper formatting (Default)
 SYSTEM_PROMPT = CASUAL_CHAT_PROMPT
 
+# System prompt for each detected intent
+INTENT_PROMPTS = {
+    'technical_support': TECHNICAL_SUPPORT_PROMPT,
+    'code_assistant': CODE_ASSISTANT_PROMPT,
+    'tutorial': TUTORIAL_PROMPT,
+    'casual_chat': CASUAL_CHAT_PROMPT
+}
+
+# Mode banner sent to the client for each detected intent
+INTENT_NAMES = {
+    'technical_support': '🔧 Technical Support Mode',
+    'code_assistant': '💻 Code Assistant Mode',
+    'tutorial': '📚 Tutorial Mode',
+    'casual_chat': '💬 Chat Mode'
+}
+
+# ============================================================
+# IN-PROCESS CACHE (LRU + TTL)
+# ============================================================
+
+# Each worker process has its own cache: invalidation only reaches the worker
+# that made the change, others keep serving entries until their TTL runs out
+
+CACHE_TTL_SECONDS = 300
+CACHE_MAX_ENTRIES = 500
+# Summaries cost an LLM call, keep them around longer
+SUMMARY_CACHE_TTL_SECONDS = 600
+# Absorbs bursts of dashboard polling of /api/sessions
+SESSIONS_LIST_CACHE_TTL_SECONDS = 5
+
+# key -> (expires_at, value), kept in least-recently-used order
+_cache = {}
+
+
+def cache_get(key):
+    """
+    Return the cached value for key, or None if it is missing or expired.
+    """
+    entry = _cache.pop(key, None)
+    if entry is None:
+        return None
+    expires_at, value = entry
+    if expires_at < time.monotonic():
+        return None
+    # Re-insert to mark as most recently used
+    _cache[key] = entry
+    return value
+
+
+def cache_set(key, value, ttl: float = CACHE_TTL_SECONDS):
+    """
+    Store value under key for ttl seconds, evicting the least recently used
+    entry when the cache is full.
+    """
+    _cache.pop(key, None)
+    if len(_cache) >= CACHE_MAX_ENTRIES:
+        _cache.pop(next(iter(_cache)))
+    _cache[key] = (time.monotonic() + ttl, value)
+
+
+def cache_invalidate(*keys):
+    """
+    Drop keys from the cache (call whenever the underlying rows change).
+    """
+    for key in keys:
+        _cache.pop(key, None)
+
+
+# /api/sessions pages are cached under a key that includes this generation,
+# so one bump retires every cached page whatever its limit/after
+_session_list_generation = 0
+
+
+def invalidate_session_lists():
+    """
+    Drop every cached session listing (call whenever a sessions row is
+    created or changes).
+    """
+    global _session_list_generation
+    _session_list_generation += 1
+    cache_invalidate(("all_sessions",))
+
+# ============================================================
+# SESSION LOG WRITER (batched inserts)
+# ============================================================
+
+# Chat messages are buffered and written to session_logs in batches by a
+# background task, so the WebSocket loop never waits on an insert of its own
+LOG_FLUSH_INTERVAL_SECONDS = 0.2
+LOG_BATCH_SIZE = 20
+
+_log_buffer = []
+_log_flush_lock = asyncio.Lock()
+# Strong references to size-triggered flush tasks
+_log_flush_tasks = set()
+
+
+def enqueue_log(session_id: str, event_type: str, message: str, metadata: dict = None):
+    """
+    Buffer a session_logs row for the next batched insert.
+    """
+    _log_buffer.append({
+        "session_id": session_id,
+        "event_type": event_type,
+        "message": message,
+        "metadata": metadata if metadata is not None else {}
+    })
+    if len(_log_buffer) >= LOG_BATCH_SIZE:
+        task = asyncio.create_task(flush_logs())
+        _log_flush_tasks.add(task)
+        task.add_done_callback(_log_flush_tasks.discard)
+
+
+def is_missing_column_error(error: Exception) -> bool:
+    """
+    Whether a PostgREST error means a column used by the query does not exist
+    (Postgres undefined_column, or PostgREST's schema-cache miss).
+    """
+    return getattr(error, 'code', None) in ('42703', 'PGRST204') or 'does not exist' in str(error)
+
+
+async def insert_logs(rows: list):
+    """
+    Insert session_logs rows in one request. If the metadata column does not
+    exist yet, the rows are written again without it.
+    """
+    try:
+        await run_query(supabase.from_("session_logs").insert(rows, returning="minimal"))
+    except Exception as e:
+        if not is_missing_column_error(e):
+            raise
+        logger.warning("[LOG] session_logs has no metadata column, writing rows without it: %s", e)
+        await run_query(supabase.from_("session_logs").insert(
+            [{k: v for k, v in row.items() if k != "metadata"} for row in rows],
+            returning="minimal"
+        ))
+
+
+async def flush_logs():
+    """
+    Insert all buffered rows in one request. Returns once every row buffered
+    before the call has been written, so readers can await it first.
+    """
+    async with _log_flush_lock:
+        if not _log_buffer:
+            return
+        batch = _log_buffer[:]
+        _log_buffer.clear()
+        try:
+            await insert_logs(batch)
+            return
+        except Exception as e:
+            logger.warning("[LOG] Batch insert of %d rows failed, writing each session separately: %s", len(batch), e)
+        # One session's bad row (or a transient error) must not cost the
+        # other sessions their messages
+        by_session = {}
+        for row in batch:
+            by_session.setdefault(row["session_id"], []).append(row)
+        results = await asyncio.gather(*(insert_logs(rows) for rows in by_session.values()), return_exceptions=True)
+        for (session_id, rows), result in zip(by_session.items(), results):
+            if isinstance(result, Exception):
+                logger.error("[LOG] Failed to write %d log rows of session %s: %s", len(rows), session_id, result)
+
+
+async def run_log_writer(stop: asyncio.Event):
+    """
+    Flush the log buffer every LOG_FLUSH_INTERVAL_SECONDS until stop is set,
+    then one last time.
+    """
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=LOG_FLUSH_INTERVAL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        await flush_logs()
+
 # ============================================================
 # TOOL EXECUTION FUNCTIONS
 # ============================================================
 
+def utc_now_iso() -> str:
+    """
+    Current UTC time as an ISO-8601 string with microseconds and offset,
+    formatted straight from time.time_ns() without building a datetime.
+    """
+    seconds, nanos = divmod(time.time_ns(), 1_000_000_000)
+    t = time.gmtime(seconds)
+    return (
+        f"{t.tm_year:04d}-{t.tm_mon:02d}-{t.tm_mday:02d}T"
+        f"{t.tm_hour:02d}:{t.tm_min:02d}:{t.tm_sec:02d}.{nanos // 1000:06d}+00:00"
+    )
+
+
+@lru_cache(maxsize=1024)
+def parse_timestamp(value: str) -> datetime:
+    """
+    Parse an ISO-8601 timestamp from Supabase into a timezone-aware UTC datetime.
+    Naive values are treated as UTC, which is how they are stored. Cached because
+    the same session start_time is parsed on every stats call.
+    """
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=UTC)
+    return parsed
+
+
+@lru_cache(maxsize=2048)
+def _parse_json_text(text: str):
+    return orjson.loads(text)
+
+
+def parse_json_field(value, default=None):
+    """
+    Return a JSONB column (topics, metrics) as Python data. Rows written before
+    these were stored natively hold JSON-encoded strings; those are parsed
+    once and cached, since finished sessions never change. Callers must not
+    mutate the returned value.
+    """
+    if not isinstance(value, str):
+        return value
+    try:
+        return _parse_json_text(value)
+    except orjson.JSONDecodeError:
+        return default
+
+
 async def execute_tool(tool_name: str, parameters: dict) -> dict:
     """
     Execute a tool based on its name and parameters.
@@ -119,7 +536,7 @@ async def execute_tool(tool_name: str, parameters: dict) -> dict:
     Returns:
         Dictionary with the tool's result
     """
-    print(f"[TOOL] Executing tool: {tool_name} with params: {parameters}")
+    logger.debug("[TOOL] Executing tool: %s with params: %s", tool_name, parameters)
     
     try:
         if tool_name == "get_session_stats":
@@ -138,10 +555,66 @@ async def execute_tool(tool_name: str, parameters: dict) -> dict:
             return {"error": f"Unknown tool: {tool_name}"}
             
     except Exception as e:
-        print(f"[TOOL] Error executing {tool_name}: {e}")
+        logger.error("[TOOL] Error executing %s: %s", tool_name, e)
         return {"error": str(e)}
 
 
+async def flush_and_execute_tool(tool_name: str, parameters: dict) -> dict:
+    """
+    Write out pending session_logs rows, then execute the tool. Tools read
+    session_logs, so they must see the message that triggered them.
+    """
+    await flush_logs()
+    return await execute_tool(tool_name, parameters)
+
+
+async def fetch_session_row(session_id: str):
+    """
+    Get a session's start_time and status, served from the cache when possible.
+    The row only changes when a session is (re)connected or finalized, and both
+    of those paths invalidate the cached copy.
+    
+    Returns the row dict, or None if the session doesn't exist.
+    """
+    cache_key = ("session", session_id)
+    session_data = cache_get(cache_key)
+    if session_data is None:
+        session = await run_query(supabase.from_("sessions").select("start_time,status").eq("session_id", session_id))
+        if not session.data:
+            return None
+        session_data = session.data[0]
+        cache_set(cache_key, session_data)
+    return session_data
+
+
+async def count_session_messages(session_id: str) -> dict:
+    """
+    Get total, user and AI message counts for a session without fetching rows.
+    
+    Counting happens in Postgres via get_session_stats_rpc (database/schema.sql).
+    If that function is not installed, three concurrent count-only (HEAD)
+    queries are used instead - they return just the count, no row data.
+    """
+    try:
+        counts = await run_query(supabase.rpc("get_session_stats_rpc", {"sid": session_id}))
+        return counts.data or {}
+    except Exception as rpc_error:
+        logger.warning("[TOOL] Stats function unavailable, counting with HEAD queries instead: %s", rpc_error)
+    
+    def count_query(event_type=None):
+        query = supabase.from_("session_logs").select("id", count="exact", head=True).eq("session_id", session_id)
+        if event_type:
+            query = query.eq("event_type", event_type)
+        return run_query(query)
+    
+    total, user, ai = await asyncio.gather(count_query(), count_query("user"), count_query("ai"))
+    return {
+        "total_messages": total.count or 0,
+        "user_messages": user.count or 0,
+        "ai_messages": ai.count or 0
+    }
+
+
 async def get_session_stats(session_id: str) -> dict:
     """
     Tool Function: Get statistics about the current session.
@@ -149,44 +622,33 @@ async def get_session_stats(session_id: str) -> dict:
     Returns message counts, duration, start time, etc.
     """
     try:
-        # Get session info
-        session = supabase.from_("sessions").select("*").eq("session_id", session_id).execute()
+        # Session info and message counts are independent - fetch them concurrently.
+        # Counts change with every message, so unlike the session row they are
+        # never cached.
+        session_data, message_counts = await asyncio.gather(
+            fetch_session_row(session_id),
+            count_session_messages(session_id)
+        )
         
-        if not session.data:
+        if not session_data:
             return {"error": "Session not found"}
         
-        session_data = session.data[0]
-        
-        # Count messages
-        logs = supabase.from_("session_logs").select("*").eq("session_id", session_id).execute()
-        
-        user_messages = [log for log in logs.data if log['event_type'] == 'user']
-        ai_messages = [log for log in logs.data if log['event_type'] == 'ai']
-        
-        # Calculate duration - handle timezone-aware and timezone-naive datetimes
+        # Calculate duration in whole seconds
+        duration_seconds = 0  # Default to 0 if the start time can't be parsed
         try:
-            start_time = datetime.fromisoformat(session_data['start_time'].replace('Z', '+00:00'))
-            # Make sure both datetimes are timezone-aware
-            if start_time.tzinfo is None:
-                # If start_time is naive, make current time naive too
-                current_time = datetime.utcnow()
-            else:
-                # If start_time is aware, make current time aware too
-                from datetime import timezone
-                current_time = datetime.now(timezone.utc)
-            
-            duration_minutes = (current_time - start_time).total_seconds() / 60
-        except Exception as date_error:
-            print(f"[TOOL] Date calculation error: {date_error}")
-            duration_minutes = 0  # Default to 0 if calculation fails
+            start_time = parse_timestamp(session_data['start_time'])
+            duration_seconds = int((datetime.now(UTC) - start_time).total_seconds())
+        except (TypeError, ValueError) as date_error:
+            logger.warning("[TOOL] Date calculation error: %s", date_error)
         
         return {
             "session_id": session_id,
             "start_time": session_data['start_time'],
-            "duration_minutes": round(duration_minutes, 2),
-            "total_messages": len(logs.data),
-            "user_messages": len(user_messages),
-            "ai_messages": len(ai_messages),
+            "duration_seconds": duration_seconds,
+            "duration_minutes": duration_seconds // 60,
+            "total_messages": message_counts.get('total_messages', 0),
+            "user_messages": message_counts.get('user_messages', 0),
+            "ai_messages": message_counts.get('ai_messages', 0),
             "status": session_data.get('status', 'active')
         }
     except Exception as e:
@@ -197,31 +659,26 @@ async def search_chat_history(session_id: str, keyword: str) -> dict:
     """
     Tool Function: Search through chat history for a keyword.
     
-    Returns messages containing the keyword.
+    Returns the best-ranked messages matching the keyword.
     """
     try:
-        # Get all messages from session
-        logs = supabase.from_("session_logs").select("*").eq("session_id", session_id).execute()
-        
-        if not logs.data:
-            return {"found": False, "message": "No messages in this session yet"}
+        # Full-text search against the GIN-indexed message_tsv column
+        # (see search_session_logs in database/schema.sql)
+        try:
+            result = await run_query(supabase.rpc("search_session_logs", {"sid": session_id, "keyword": keyword}))
+        except Exception as rpc_error:
+            # Search function not installed yet - fall back to substring matching
+            logger.warning("[TOOL] Full-text search unavailable, using substring search instead: %s", rpc_error)
+            return await substring_search_chat_history(session_id, keyword)
         
-        # Search for keyword (case-insensitive)
-        matching_messages = []
-        for log in logs.data:
-            if keyword.lower() in log['message'].lower():
-                matching_messages.append({
-                    "type": log['event_type'],
-                    "message": log['message'],
-                    "id": log['id']
-                })
+        search = result.data or {}
         
-        if matching_messages:
+        if search.get('matches'):
             return {
                 "found": True,
                 "keyword": keyword,
-                "matches": len(matching_messages),
-                "messages": matching_messages[:5]  # Return top 5 matches
+                "matches": search['matches'],
+                "messages": search['messages']  # Top 5 matches by relevance
             }
         else:
             return {
@@ -233,15 +690,53 @@ async def search_chat_history(session_id: str, keyword: str) -> dict:
         return {"error": str(e)}
 
 
+async def substring_search_chat_history(session_id: str, keyword: str) -> dict:
+    """
+    Fallback for search_chat_history when the full-text search function is
+    not available: case-insensitive substring match (ILIKE), served by the
+    trigram index on session_logs.message. Returns the first 5 matches plus
+    the exact total in a single request.
+    """
+    # Escape LIKE wildcards so the keyword is matched literally
+    pattern = keyword.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    logs = await run_query(
+        supabase.from_("session_logs").select("id,event_type,message", count="exact")
+        .eq("session_id", session_id).ilike("message", f"%{pattern}%").order("id").limit(5)
+    )
+    
+    if logs.data:
+        return {
+            "found": True,
+            "keyword": keyword,
+            "matches": logs.count or len(logs.data),
+            "messages": [
+                {"type": log['event_type'], "message": log['message'], "id": log['id']}
+                for log in logs.data
+            ]  # Return top 5 matches
+        }
+    else:
+        return {
+            "found": False,
+            "keyword": keyword,
+            "message": f"No messages found containing '{keyword}'"
+        }
+
+
 async def get_all_sessions() -> dict:
     """
     Tool Function: Get list of all previous sessions.
     
     Returns recent sessions with basic info.
     """
+    cached = cache_get(("all_sessions",))
+    if cached is not None:
+        return cached
+    
     try:
         # Get recent sessions (last 10)
-        sessions = supabase.from_("sessions").select("*").order("start_time", desc=True).limit(10).execute()
+        sessions = await run_query(
+            supabase.from_("sessions").select("session_id,start_time,status,summary").order("start_time", desc=True).limit(10)
+        )
         
         if not sessions.data:
             return {"message": "No previous sessions found"}
@@ -252,13 +747,15 @@ async def get_all_sessions() -> dict:
                 "session_id": session['session_id'],
                 "start_time": session['start_time'],
                 "status": session.get('status', 'unknown'),
-                "summary": session.get('summary', 'No summary available')[:100]  # First 100 chars
+                "summary": (session.get('summary') or 'No summary available')[:100]  # First 100 chars
             })
         
-        return {
+        result = {
             "total_sessions": len(session_list),
             "sessions": session_list
         }
+        cache_set(("all_sessions",), result)
+        return result
     except Exception as e:
         return {"error": str(e)}
 
@@ -266,212 +763,518 @@ async def get_all_sessions() -> dict:
 # INTENT DETECTION (Multi-Step Routing)
 # ============================================================
 
+# Intent keywords in routing precedence order (first entry wins when a
+# message matches several intents)
+INTENT_KEYWORDS = (
+    # Technical Support - matches whole words or phrases
+    ('technical_support', ('error', 'bug', 'not working', 'broken', 'issue', 'problem', 'fix', 'help',
+                           'troubleshoot', 'debug', "doesn't work", 'failing', 'crashed', 'exception')),
+    # Code Assistant - matches programming-related terms
+    ('code_assistant', ('code', 'function', 'python', 'javascript', 'java', 'c++', 'programming', 'algorithm',
+                        'syntax', 'class', 'variable', 'loop', 'api', 'write a', 'create a function',
+                        'how to code', 'implement', 'method', 'array', 'object')),
+    # Tutorial - matches learning-related phrases
+    ('tutorial', ('how to', 'teach me', 'explain', 'what is', 'tutorial', 'learn', 'understand', 'show me how',
+                  'step by step', 'can you explain', 'help me understand', 'guide me')),
+)
+
+# All intents compiled once into a single case-insensitive alternation with
+# one named group per intent, so a message is scanned in one pass instead of
+# once per intent (and without making a lowercased copy first)
+INTENT_RE = re.compile('|'.join(
+    rf"(?P<{intent}>\b(?:{'|'.join(map(re.escape, keywords))})\b)" for intent, keywords in INTENT_KEYWORDS
+), re.IGNORECASE)
+INTENT_PRIORITY = {intent: priority for priority, (intent, _) in enumerate(INTENT_KEYWORDS)}
+
+
 def detect_intent(message: str) -> str:
     """
     Detect the user's intent from their message using regex pattern matching.
     This determines which system prompt to use.
-    
+
     Returns one of: 'technical_support', 'code_assistant', 'tutorial', 'casual_chat'
     """
-    message_lower = message.lower()
-    
-    # Technical Support patterns - matches whole words or phrases
-    technical_pattern = r'\b(error|bug|not working|broken|issue|problem|fix|help|troubleshoot|debug|doesn\'t work|failing|crashed|exception)\b'
-    
-    # Code Assistant patterns - matches programming-related terms
-    code_pattern = r'\b(code|function|python|javascript|java|c\+\+|programming|algorithm|syntax|class|variable|loop|api|write a|create a function|how to code|implement|method|array|object)\b'
-    
-    # Tutorial patterns - matches learning-related phrases
-    tutorial_pattern = r'\b(how to|teach me|explain|what is|tutorial|learn|understand|show me how|step by step|can you explain|help me understand|guide me)\b'
-    
-    # Check for technical support intent
-    if re.search(technical_pattern, message_lower, re.IGNORECASE):
-        return 'technical_support'
-    
-    # Check for code assistant intent
-    if re.search(code_pattern, message_lower, re.IGNORECASE):
-        return 'code_assistant'
-    
-    # Check for tutorial intent
-    if re.search(tutorial_pattern, message_lower, re.IGNORECASE):
-        return 'tutorial'
-    
-    # Default to casual chat
-    return 'casual_chat'
+    # Single scan over the message, keeping the highest-precedence intent seen
+    best_intent = 'casual_chat'
+    best_priority = len(INTENT_KEYWORDS)
+    for match in INTENT_RE.finditer(message):
+        priority = INTENT_PRIORITY[match.lastgroup]
+        if priority < best_priority:
+            best_intent, best_priority = match.lastgroup, priority
+            if priority == 0:
+                # Nothing outranks technical support
+                break
+
+    return best_intent
 
 
 def get_system_prompt_for_intent(intent: str) -> str:
     """
     Get the appropriate system prompt based on detected intent.
     """
-    prompts = {
-        'technical_support': TECHNICAL_SUPPORT_PROMPT,
-        'code_assistant': CODE_ASSISTANT_PROMPT,
-        'tutorial': TUTORIAL_PROMPT,
-        'casual_chat': CASUAL_CHAT_PROMPT
-    }
-    
-    return prompts.get(intent, CASUAL_CHAT_PROMPT)
+    return INTENT_PROMPTS.get(intent, CASUAL_CHAT_PROMPT)
 
 # ============================================================
 # TOOL DETECTION & PARAMETER EXTRACTION
 # ============================================================
 
+# Tool trigger phrases in precedence order (first entry wins when a message
+# matches several tools). Matched as plain substrings, case-insensitively.
+TOOL_KEYWORDS = (
+    # Session stats queries
+    ('get_session_stats', ('how many messages', 'message count', 'how long', 'duration',
+                           'session stats', 'my activity', 'how many times')),
+    # History search queries
+    ('search_chat_history', ('did i mention', 'what did we discuss', 'did we talk about',
+                             'search for', 'find in history', 'previous conversation')),
+    # Session list queries
+    ('get_all_sessions', ('my previous chats', 'chat history', 'all sessions',
+                          'past conversations', 'show my sessions')),
+)
+
+# Single alternation with one named group per tool, compiled once
+TOOL_RE = re.compile('|'.join(
+    f"(?P<{tool}>{'|'.join(map(re.escape, keywords))})" for tool, keywords in TOOL_KEYWORDS
+), re.IGNORECASE)
+TOOL_PRIORITY = {tool: priority for priority, (tool, _) in enumerate(TOOL_KEYWORDS)}
+# Messages shorter than the shortest keyword ("hi", "thanks") cannot match
+TOOL_MIN_KEYWORD_LENGTH = min(len(keyword) for _, keywords in TOOL_KEYWORDS for keyword in keywords)
+
+
 def should_use_tool(message: str, session_id: str) -> tuple:
     """
     Determine if a tool should be used based on the user's message.
     
     Returns: (should_use: bool, tool_name: str, parameters: dict)
     """
-    message_lower = message.lower()
+    if len(message) < TOOL_MIN_KEYWORD_LENGTH:
+        return (False, None, None)
+    
+    # Single scan over the message, keeping the highest-precedence tool seen
+    tool_name = None
+    best_priority = len(TOOL_KEYWORDS)
+    for match in TOOL_RE.finditer(message):
+        priority = TOOL_PRIORITY[match.lastgroup]
+        if priority < best_priority:
+            tool_name, best_priority = match.lastgroup, priority
+            if priority == 0:
+                break
     
-    # Check for session stats queries
-    stats_keywords = ['how many messages', 'message count', 'how long', 'duration',
-                     'session stats', 'my activity', 'how many times']
-    if any(keyword in message_lower for keyword in stats_keywords):
+    if tool_name == "get_session_stats":
         return (True, "get_session_stats", {"session_id": session_id})
     
-    # Check for history search queries
-    history_keywords = ['did i mention', 'what did we discuss', 'did we talk about',
-                       'search for', 'find in history', 'previous conversation']
-    if any(keyword in message_lower for keyword in history_keywords):
+    if tool_name == "search_chat_history":
         # Try to extract keyword (simple approach)
         keyword = extract_search_keyword(message)
         return (True, "search_chat_history", {"session_id": session_id, "keyword": keyword})
     
-    # Check for session list queries
-    session_list_keywords = ['my previous chats', 'chat history', 'all sessions',
-                            'past conversations', 'show my sessions']
-    if any(keyword in message_lower for keyword in session_list_keywords):
+    if tool_name == "get_all_sessions":
         return (True, "get_all_sessions", {})
     
     # No tool needed
     return (False, None, None)
 
 
+# Phrases that precede the search term, in precedence order: the first
+# phrase found anywhere in the message wins, regardless of position
+SEARCH_KEYWORD_MARKERS = ('about ', 'mention ', 'discuss ', 'talk about ', 'said about ',
+                          'for ', 'regarding ')
+
+# One lookahead per marker, tried in order from the start of the message, each
+# capturing the first word after its marker without surrounding '?', ',' or '.'.
+# A single match() call replaces a substring scan, split() and strip() per marker.
+SEARCH_KEYWORD_RE = re.compile(r'\A(?:' + '|'.join(
+    rf'(?=.*?{re.escape(marker)}\s*[?,.]*(\S*?)[?,.]*(?!\S))' for marker in SEARCH_KEYWORD_MARKERS
+) + ')', re.IGNORECASE | re.DOTALL)
+
+
 def extract_search_keyword(message: str) -> str:
     """
     Simple keyword extraction from search queries.
     Looks for words after 'about', 'for', 'mention' etc.
     """
-    message_lower = message.lower()
-    
     # Common patterns: "what did we discuss about X", "did I mention Y"
-    patterns = [
-        'about ', 'mention ', 'discuss ', 'talk about ', 'said about ',
-        'for ', 'regarding '
-    ]
-    
-    for pattern in patterns:
-        if pattern in message_lower:
-            # Extract text after the pattern
-            parts = message_lower.split(pattern, 1)
-            if len(parts) > 1:
-                # Get first few words after pattern
-                keyword = parts[1].strip().split()[0] if parts[1].strip() else "unknown"
-                return keyword.strip('?,.')
+    match = SEARCH_KEYWORD_RE.match(message)
+    if match:
+        keyword = match.group(match.lastindex)
+        return keyword.lower() if keyword else "unknown"
     
     # Default: use last word of message
-    words = message.split()
-    return words[-1].strip('?,.') if words else "unknown"
+    return message.rsplit(None, 1)[-1].strip('?,.') if message.strip() else "unknown"
+
+# Static parts of the summary prompt; only the transcript in between changes
+SUMMARY_PROMPT_HEAD = """Analyze the following conversation and provide a professional summary.
+
+Conversation:
+"""
+
+SUMMARY_EXAMPLE = """{
+  "summary": "The user asked about Python programming concepts. We discussed variables, data types, and control structures. The conversation covered practical examples and best practices for beginners.",
+  "topics": ["Python basics", "Variables", "Data types", "Control structures"],
+  "sentiment": "positive",
+  "key_outcomes": "User gained understanding of fundamental Python concepts and received code examples for practice."
+}"""
+
+SUMMARY_PROMPT_TAIL = """
+
+Create a comprehensive analysis with:
+1. A clear, readable summary (3-4 sentences describing what was discussed and accomplished)
+2. Main topics discussed (3-5 key topics as a simple array)
+3. Overall sentiment (choose one: positive, neutral, or negative)
+4. Key outcomes or conclusions (1-2 sentences about what was learned or achieved)
+
+IMPORTANT: Respond with ONLY valid JSON. No markdown, no code blocks, no extra text. Just the raw JSON object.
+
+Example format:
+""" + SUMMARY_EXAMPLE
+
+# Batched variant: several conversations summarized by a single LLM call
+SUMMARY_BATCH_PROMPT_HEAD = """Analyze each of the following {count} conversations independently and provide a professional summary of each.
+
+"""
+
+SUMMARY_BATCH_PROMPT_TAIL = """For each conversation, create a comprehensive analysis with:
+1. A clear, readable summary (3-4 sentences describing what was discussed and accomplished)
+2. Main topics discussed (3-5 key topics as a simple array)
+3. Overall sentiment (choose one: positive, neutral, or negative)
+4. Key outcomes or conclusions (1-2 sentences about what was learned or achieved)
+
+IMPORTANT: Respond with ONLY a valid JSON array containing exactly one object per conversation. Each object must have a "conversation" field with the number of the conversation it describes (as in "=== Conversation N ==="). No markdown, no code blocks, no extra text. Just the raw JSON array.
+
+Format of each object in the array:
+""" + '{\n  "conversation": 1,' + SUMMARY_EXAMPLE[1:]
+
+# ============================================================
+# SUMMARY GENERATION (with burst batching)
+# ============================================================
+
+# When several sessions finish within SUMMARY_BATCH_WINDOW_SECONDS of each
+# other, their summaries are requested from the model in one call (up to
+# SUMMARY_BATCH_SIZE at a time). A lone session is summarized immediately
+# with its own prompt.
+SUMMARY_BATCH_SIZE = 8
+SUMMARY_BATCH_WINDOW_SECONDS = 0.2
+SUMMARY_BATCH_THRESHOLD = 2
+# Long transcripts are always summarized on their own to keep prompts small
+SUMMARY_BATCH_MAX_CHARS = 8000
+
+# (conversation_text, future) pairs waiting for the next batch
+_summary_queue = []
+# Summaries currently being generated; with none running, a new session is
+# alone and skips the batch window
+_summary_in_flight = 0
+_summary_flush_timer = None
+# Strong references to running batch tasks so they are not garbage collected
+_summary_tasks = set()
+
+
+async def _summarize_one(conversation_text: str) -> dict:
+    """
+    Summarize a single conversation with its own prompt.
+    """
+    summary_prompt = SUMMARY_PROMPT_HEAD + conversation_text + SUMMARY_PROMPT_TAIL
+
+    logger.debug("[SUMMARY] Calling AI for analysis...")
+    summary_response = await get_model().ainvoke([("human", summary_prompt)])
+    logger.debug("[SUMMARY] AI response received: %.100s...", summary_response.content)
+    
+    # Parse AI response
+    try:
+        summary_data = orjson.loads(summary_response.content)
+        logger.debug("[SUMMARY] Successfully parsed JSON response")
+    except orjson.JSONDecodeError as je:
+        logger.warning("[SUMMARY] Failed to parse JSON, using fallback summary data: %s", je)
+        # Fallback if AI doesn't return valid JSON
+        summary_data = {
+            "summary": summary_response.content[:200] if len(summary_response.content) > 0 else "Conversation completed",
+            "topics": ["General conversation"],
+            "sentiment": "neutral",
+            "key_outcomes": "Session completed"
+        }
+    return summary_data
+
+
+async def _summarize_many(conversation_texts: list) -> list:
+    """
+    Summarize several conversations with one LLM call. Results are matched
+    to conversations by their "conversation" number, never by position;
+    raises ValueError unless the numbers are exactly 1..n.
+    """
+    prompt = io.StringIO()
+    prompt.write(SUMMARY_BATCH_PROMPT_HEAD.format(count=len(conversation_texts)))
+    for i, text in enumerate(conversation_texts, 1):
+        prompt.write(f"=== Conversation {i} ===\n")
+        prompt.write(text)
+        prompt.write("\n\n")
+    prompt.write(SUMMARY_BATCH_PROMPT_TAIL)
+
+    logger.debug("[SUMMARY] Calling AI for a batch of %d conversations...", len(conversation_texts))
+    response = await get_model().ainvoke([("human", prompt.getvalue())])
+    summaries = orjson.loads(response.content)
+    if not isinstance(summaries, list) or not all(isinstance(item, dict) for item in summaries):
+        raise ValueError("batched summary response is not a list of objects")
+    numbers = [item.get("conversation") for item in summaries]
+    expected = list(range(1, len(conversation_texts) + 1))
+    if any(type(number) is not int for number in numbers) or sorted(numbers) != expected:
+        raise ValueError("batched summary response does not match the conversations")
+    by_number = {item["conversation"]: item for item in summaries}
+    return [
+        {k: v for k, v in by_number[number].items() if k != "conversation"}
+        for number in expected
+    ]
+
+
+async def _summarize_batch(batch: list):
+    """
+    Resolve the futures of a drained batch, falling back to one call per
+    conversation if the batched call fails.
+    """
+    texts = [text for text, _ in batch]
+    try:
+        results = None
+        if len(batch) >= SUMMARY_BATCH_THRESHOLD:
+            try:
+                results = await _summarize_many(texts)
+            except Exception as e:
+                logger.warning("[SUMMARY] Batched summary failed, summarizing %d sessions individually: %s", len(batch), e)
+        if results is None:
+            results = await asyncio.gather(*(_summarize_one(text) for text in texts), return_exceptions=True)
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+    except BaseException as e:
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(e)
+        raise
+
+
+def _flush_summary_queue():
+    """
+    Drain the queue into a background batch task.
+    """
+    global _summary_flush_timer
+    if _summary_flush_timer is not None and _summary_flush_timer is not asyncio.current_task():
+        _summary_flush_timer.cancel()
+    _summary_flush_timer = None
+    batch = _summary_queue[:]
+    _summary_queue.clear()
+    if len(batch) >= SUMMARY_BATCH_THRESHOLD:
+        batches = [batch]
+    else:
+        # Too few to batch: send each one with its own prompt right away
+        batches = [[item] for item in batch]
+    for items in batches:
+        task = asyncio.create_task(_summarize_batch(items))
+        _summary_tasks.add(task)
+        task.add_done_callback(_summary_tasks.discard)
+
+
+async def _flush_summary_queue_later():
+    await asyncio.sleep(SUMMARY_BATCH_WINDOW_SECONDS)
+    _flush_summary_queue()
+
+
+async def summarize_conversation(conversation_text: str) -> dict:
+    """
+    Ask the model for the summary/topics/sentiment/key_outcomes of one
+    conversation, coalescing with other sessions that finish at the same time.
+    """
+    global _summary_flush_timer, _summary_in_flight
+    alone = _summary_in_flight == 0 and not _summary_queue
+    _summary_in_flight += 1
+    try:
+        if alone or len(conversation_text) > SUMMARY_BATCH_MAX_CHARS:
+            return await _summarize_one(conversation_text)
+
+        future = asyncio.get_running_loop().create_future()
+        _summary_queue.append((conversation_text, future))
+        if len(_summary_queue) >= SUMMARY_BATCH_SIZE:
+            _flush_summary_queue()
+        elif _summary_flush_timer is None:
+            _summary_flush_timer = asyncio.create_task(_flush_summary_queue_later())
+        return await future
+    finally:
+        _summary_in_flight -= 1
+
+def unwrap_summary_text(summary):
+    """
+    Some summaries were stored as the model's whole JSON object instead of its
+    "summary" field. Return the plain summary text in either case.
+    """
+    if not isinstance(summary, str) or not summary.lstrip().startswith('{'):
+        return summary
+    try:
+        parsed = orjson.loads(summary)
+    except orjson.JSONDecodeError:
+        return summary
+    if isinstance(parsed, dict):
+        return parsed.get('summary') or parsed.get('text') or summary
+    return summary
+
+
+def stored_session_summary(row, message_count: int):
+    """
+    Rebuild the summary saved on a sessions row, or return None if there is
+    none or it was generated for a different number of messages.
+    """
+    if not row or not row.get('summary'):
+        return None
+    topics = parse_json_field(row.get('topics'), [])
+    metrics = parse_json_field(row.get('metrics'))
+    if not isinstance(metrics, dict) or metrics.get('total_messages') != message_count:
+        return None
+    return {
+        "summary": row['summary'],
+        "topics": topics or [],
+        "sentiment": row.get('sentiment') or "neutral",
+        "key_outcomes": row.get('key_outcomes') or "",
+        "metrics": metrics
+    }
+
 
 # Helper function to generate session summary
-async def generate_session_summary(session_id: str) -> dict:
+async def fetch_session_transcript(session_id: str) -> dict:
+    """
+    Get a session's transcript ("User: ..." / "AI: ..." lines in conversation
+    order) together with its message and word counts and the last log id.
+
+    The transcript is joined in Postgres by get_session_transcript
+    (database/schema.sql), so only one string crosses the wire. If that
+    function is not installed, the rows are fetched and joined here instead.
+    """
+    try:
+        result = await run_query(supabase.rpc("get_session_transcript", {"sid": session_id}))
+        return result.data
+    except Exception as rpc_error:
+        logger.warning("[SUMMARY] Transcript function unavailable, joining messages in Python instead: %s", rpc_error)
+    
+    # id is the primary key, so rows come back in conversation order
+    logs = await run_query(
+        supabase.from_("session_logs")
+        .select("id,event_type,message")
+        .eq("session_id", session_id)
+        .order("id")
+    )
+    rows = logs.data or []
+    
+    # Build the transcript and message metrics in a single pass,
+    # writing straight into one buffer
+    conversation = io.StringIO()
+    user_count = ai_count = user_words = ai_words = 0
+    
+    for log in rows:
+        message = log['message']
+        if log['event_type'] == 'user':
+            label = "User: "
+            user_count += 1
+            user_words += len(message.split())
+        elif log['event_type'] == 'ai':
+            label = "AI: "
+            ai_count += 1
+            ai_words += len(message.split())
+        else:
+            continue
+        if conversation.tell():
+            conversation.write("\n")
+        conversation.write(label)
+        conversation.write(message)
+    
+    return {
+        "transcript": conversation.getvalue(),
+        "total_messages": len(rows),
+        "last_id": rows[-1]['id'] if rows else None,
+        "user_messages": user_count,
+        "ai_messages": ai_count,
+        "user_words": user_words,
+        "ai_words": ai_words,
+    }
+
+
+async def generate_session_summary(session_id: str, use_cache: bool = True) -> dict:
     """
     Generate a comprehensive summary of the chat session using AI.
+
+    The result is cached per session together with a fingerprint of the
+    conversation, so finalizing a session again without new messages reuses
+    the previous summary instead of calling the model. The summary stored on
+    the session row is reused the same way (e.g. after a restart). Pass
+    use_cache=False to force a fresh summary.
     """
     try:
-        print(f"[SUMMARY] Starting summary generation for session: {session_id}")
+        logger.debug("[SUMMARY] Starting summary generation for session: %s", session_id)
         
-        # Fetch all messages from the session (order by id if created_at doesn't exist)
-        try:
-            logs = supabase.from_("session_logs").select("*").eq("session_id", session_id).order("id").execute()
-        except Exception as e:
-            print(f"[SUMMARY] Error ordering by id, trying without order: {e}")
-            logs = supabase.from_("session_logs").select("*").eq("session_id", session_id).execute()
+        transcript_query = fetch_session_transcript(session_id)
+        if use_cache:
+            # Fetch the stored summary alongside, in case it is still current
+            transcript, stored = await asyncio.gather(
+                transcript_query,
+                run_query(
+                    supabase.from_("sessions")
+                    .select("summary,topics,sentiment,metrics,key_outcomes")
+                    .eq("session_id", session_id)
+                    .limit(1)
+                ),
+                return_exceptions=True,
+            )
+            if isinstance(transcript, Exception):
+                raise transcript
+            if isinstance(stored, Exception):
+                logger.warning("[SUMMARY] Could not load stored summary: %s", stored)
+                stored = None
+        else:
+            transcript, stored = await transcript_query, None
         
-        print(f"[SUMMARY] Found {len(logs.data) if logs.data else 0} log entries")
+        total_messages = transcript['total_messages']
+        logger.debug("[SUMMARY] Found %d log entries", total_messages)
         
-        if not logs.data or len(logs.data) == 0:
-            print(f"[SUMMARY] No messages found in session")
+        if not total_messages:
+            logger.debug("[SUMMARY] No messages found in session")
             return {"summary": "No messages in session", "topics": [], "sentiment": "neutral", "metrics": {}}
         
-        # Build conversation history
-        conversation = []
-        user_messages = []
-        ai_messages = []
+        # The summary only depends on the logged messages
+        fingerprint = (total_messages, transcript['last_id'])
+        cache_key = ("summary", session_id)
+        cached = cache_get(cache_key) if use_cache else None
+        if cached is not None and cached[0] == fingerprint:
+            logger.debug("[SUMMARY] Conversation unchanged, reusing cached summary")
+            return cached[1]
         
-        for log in logs.data:
-            if log['event_type'] == 'user':
-                conversation.append(f"User: {log['message']}")
-                user_messages.append(log['message'])
-            elif log['event_type'] == 'ai':
-                conversation.append(f"AI: {log['message']}")
-                ai_messages.append(log['message'])
+        stored_summary = stored_session_summary(stored.data[0] if stored and stored.data else None, total_messages)
+        if stored_summary is not None:
+            logger.debug("[SUMMARY] Conversation unchanged since the stored summary, reusing it")
+            cache_set(cache_key, (fingerprint, stored_summary), ttl=SUMMARY_CACHE_TTL_SECONDS)
+            return stored_summary
         
-        print(f"[SUMMARY] User messages: {len(user_messages)}, AI messages: {len(ai_messages)}")
+        logger.debug("[SUMMARY] User messages: %d, AI messages: %d", transcript['user_messages'], transcript['ai_messages'])
         
-        conversation_text = "\n".join(conversation)
+        conversation_text = transcript['transcript']
         
         # Generate summary using AI
-        summary_prompt = f"""Analyze the following conversation and provide a professional summary.
-
-Conversation:
-{conversation_text}
-
-Create a comprehensive analysis with:
-1. A clear, readable summary (3-4 sentences describing what was discussed and accomplished)
-2. Main topics discussed (3-5 key topics as a simple array)
-3. Overall sentiment (choose one: positive, neutral, or negative)
-4. Key outcomes or conclusions (1-2 sentences about what was learned or achieved)
-
-IMPORTANT: Respond with ONLY valid JSON. No markdown, no code blocks, no extra text. Just the raw JSON object.
-
-Example format:
-{{
-  "summary": "The user asked about Python programming concepts. We discussed variables, data types, and control structures. The conversation covered practical examples and best practices for beginners.",
-  "topics": ["Python basics", "Variables", "Data types", "Control structures"],
-  "sentiment": "positive",
-  "key_outcomes": "User gained understanding of fundamental Python concepts and received code examples for practice."
-}}"""
-
-        print(f"[SUMMARY] Calling AI for analysis...")
-        summary_response = model.invoke([("human", summary_prompt)])
-        print(f"[SUMMARY] AI response received: {summary_response.content[:100]}...")
-        
-        # Parse AI response
-        try:
-            summary_data = json.loads(summary_response.content)
-            print(f"[SUMMARY] Successfully parsed JSON response")
-        except json.JSONDecodeError as je:
-            print(f"[SUMMARY] Failed to parse JSON: {je}")
-            # Fallback if AI doesn't return valid JSON
-            summary_data = {
-                "summary": summary_response.content[:200] if len(summary_response.content) > 0 else "Conversation completed",
-                "topics": ["General conversation"],
-                "sentiment": "neutral",
-                "key_outcomes": "Session completed"
-            }
-            print(f"[SUMMARY] Using fallback summary data")
+        summary_data = await summarize_conversation(conversation_text)
         
         # Calculate metrics
         metrics = {
-            "total_messages": len(logs.data),
-            "user_messages": len(user_messages),
-            "ai_messages": len(ai_messages),
-            "total_user_words": sum(len(msg.split()) for msg in user_messages),
-            "total_ai_words": sum(len(msg.split()) for msg in ai_messages),
+            "total_messages": total_messages,
+            "user_messages": transcript['user_messages'],
+            "ai_messages": transcript['ai_messages'],
+            "total_user_words": transcript['user_words'],
+            "total_ai_words": transcript['ai_words'],
         }
         
-        return {
+        result = {
             **summary_data,
             "metrics": metrics
         }
+        cache_set(cache_key, (fingerprint, result), ttl=SUMMARY_CACHE_TTL_SECONDS)
+        return result
         
     except Exception as e:
-        print(f"[SUMMARY] ERROR generating session summary: {e}")
-        import traceback
-        print(f"[SUMMARY] Traceback: {traceback.format_exc()}")
+        logger.error("[SUMMARY] ERROR generating session summary: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG))
         return {
             "summary": f"Error generating summary: {str(e)}",
             "topics": [],
@@ -485,54 +1288,96 @@ async def finalize_session(session_id: str):
     Finalize the session by generating summary and updating the database.
     """
     try:
-        print(f"[FINALIZE] ============================================")
-        print(f"[FINALIZE] Starting finalization for session: {session_id}")
-        print(f"[FINALIZE] ============================================")
+        logger.info("[FINALIZE] Starting finalization for session: %s", session_id)
+        
+        # Make sure the last messages are stored before summarizing
+        await flush_logs()
         
         # Generate comprehensive summary
         session_analysis = await generate_session_summary(session_id)
         
-        print(f"[FINALIZE] Summary generated: {session_analysis.get('summary', 'N/A')[:100]}...")
+        logger.debug("[FINALIZE] Summary generated: %.100s...", session_analysis.get('summary', 'N/A'))
         
         # Update session record with end time and summary
         update_data = {
-            "end_time": datetime.utcnow().isoformat(),
-            "summary": session_analysis.get("summary", ""),
-            "topics": json.dumps(session_analysis.get("topics", [])),
+            "end_time": utc_now_iso(),
+            "summary": unwrap_summary_text(session_analysis.get("summary", "")),
+            "topics": session_analysis.get("topics", []),
             "sentiment": session_analysis.get("sentiment", "neutral"),
-            "metrics": json.dumps(session_analysis.get("metrics", {})),
+            "metrics": session_analysis.get("metrics", {}),
             "status": "completed"
         }
         
-        print(f"[FINALIZE] Updating database with summary data...")
-        result = supabase.from_("sessions").update(update_data).eq("session_id", session_id).execute()
-        print(f"[FINALIZE] Database updated. Rows affected: {len(result.data) if result.data else 0}")
+        logger.debug("[FINALIZE] Updating database with summary data...")
+        result = await run_query(supabase.from_("sessions").update(update_data).eq("session_id", session_id))
+        cache_invalidate(("session", session_id))
+        invalidate_session_lists()
+        logger.debug("[FINALIZE] Database updated. Rows affected: %d", len(result.data) if result.data else 0)
         
-        print(f"[FINALIZE] ✅ Session {session_id[:8]}... finalized successfully")
-        print(f"[FINALIZE] ============================================")
+        logger.info("[FINALIZE] ✅ Session %.8s... finalized successfully", session_id)
         
         return session_analysis
         
     except Exception as e:
-        print(f"[FINALIZE] ❌ ERROR finalizing session {session_id}: {e}")
-        import traceback
-        print(f"[FINALIZE] Traceback: {traceback.format_exc()}")
+        logger.error("[FINALIZE] ❌ ERROR finalizing session %s: %s", session_id, e, exc_info=logger.isEnabledFor(logging.DEBUG))
         # Try to at least update the end time
         try:
-            supabase.from_("sessions").update({
-                "end_time": datetime.utcnow().isoformat(),
+            await run_query(supabase.from_("sessions").update({
+                "end_time": utc_now_iso(),
                 "status": "completed_with_errors"
-            }).eq("session_id", session_id).execute()
-            print(f"[FINALIZE] Updated end_time with error status")
+            }).eq("session_id", session_id))
+            cache_invalidate(("session", session_id))
+            invalidate_session_lists()
+            logger.info("[FINALIZE] Updated end_time with error status")
         except Exception as e2:
-            print(f"[FINALIZE] Failed to update end_time: {e2}")
+            logger.error("[FINALIZE] Failed to update end_time: %s", e2)
+
+# At most this many sessions are summarized at the same time
+MAX_CONCURRENT_FINALIZE = 8
+_finalize_semaphore = asyncio.Semaphore(MAX_CONCURRENT_FINALIZE)
+# Strong references to running finalize tasks so they are not garbage collected
+_finalize_tasks = set()
+
+
+async def _finalize_bounded(session_id: str):
+    async with _finalize_semaphore:
+        await finalize_session(session_id)
+
+
+def schedule_finalize(session_id: str) -> asyncio.Task:
+    """
+    Finalize a session in the background so the caller does not wait for the
+    LLM summary. The client polls the summary API until the status changes.
+    """
+    task = asyncio.create_task(_finalize_bounded(session_id))
+    _finalize_tasks.add(task)
+    task.add_done_callback(_finalize_tasks.discard)
+    return task
+
+_STYLE_RE = re.compile(r"(<style>)(.*?)(</style>)", re.DOTALL)
+_CSS_COMMENT_RE = re.compile(r"/\*.*?\*/", re.DOTALL)
+_CSS_PUNCT_SPACE_RE = re.compile(r"\s*([{};,])\s*|:\s+")
+
+
+def minify_styles(page: str) -> str:
+    """
+    Minify the <style> blocks of an HTML page: drop comments, collapse
+    whitespace and the last semicolon of each rule. Run once at import, so
+    the pages keep their readable CSS in source.
+    """
+    def minify(css: str) -> str:
+        css = _CSS_COMMENT_RE.sub("", css)
+        css = re.sub(r"\s+", " ", css)
+        css = _CSS_PUNCT_SPACE_RE.sub(lambda m: m.group(1) or ":", css)
+        return css.replace(";}", "}").strip()
+    return _STYLE_RE.sub(lambda m: m.group(1) + minify(m.group(2)) + m.group(3), page)
 
 html = """
 <!DOCTYPE html>
 <html>
     <head>
         <title>Chat</title>
-        <script src="https://cdn.jsdelivr.net/npm/marked/marked.min.js"></script>
+        <script src="https://cdn.jsdelivr.net/npm/marked@15.0.12/marked.min.js"></script>
         <style>
             body {
                 font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, Oxygen, Ubuntu, Cantarell, sans-serif;
@@ -775,6 +1620,22 @@ html = """
                 chatContainer.scrollTop = chatContainer.scrollHeight;
             }
             
+            // Markdown is re-rendered at most once per RENDER_INTERVAL_MS while
+            // streaming; tokens in between are appended as plain text
+            var RENDER_INTERVAL_MS = 50;
+            var renderTimer = null;
+            
+            function renderAIMessage() {
+                if (renderTimer) {
+                    clearTimeout(renderTimer);
+                    renderTimer = null;
+                }
+                if (!currentAIMessage) return;
+                var contentDiv = currentAIMessage.querySelector('.message-content');
+                contentDiv.innerHTML = marked.parse(currentAIContent);
+                chatContainer.scrollTop = chatContainer.scrollHeight;
+            }
+            
             function updateAIMessage(token) {
                 if (!currentAIMessage) {
                     currentAIMessage = addMessage('', 'ai');
@@ -783,11 +1644,22 @@ html = """
                 
                 currentAIContent += token;
                 var contentDiv = currentAIMessage.querySelector('.message-content');
-                contentDiv.innerHTML = marked.parse(currentAIContent);
+                var last = contentDiv.lastChild;
+                if (last && last.nodeType === Node.TEXT_NODE) {
+                    last.appendData(token);
+                } else {
+                    contentDiv.appendChild(document.createTextNode(token));
+                }
                 chatContainer.scrollTop = chatContainer.scrollHeight;
+                
+                if (!renderTimer) {
+                    renderTimer = setTimeout(renderAIMessage, RENDER_INTERVAL_MS);
+                }
             }
             
             function finalizeAIMessage() {
+                // Final full render of the complete message
+                renderAIMessage();
                 currentAIMessage = null;
                 currentAIContent = '';
             }
@@ -843,11 +1715,17 @@ html = """
                 
                 addMessage('Session ended. Generating summary...', 'system');
                 
-                // Fetch and display brief summary
-                setTimeout(function() {
+                // The summary is generated in the background: poll until the
+                // session is no longer active, then display a brief summary
+                var summaryAttempts = 0;
+                function pollSummary() {
                     fetch('/api/session/' + sessionId + '/summary')
                         .then(response => response.json())
                         .then(data => {
+                            if (data.status === 'active' && ++summaryAttempts < 20) {
+                                setTimeout(pollSummary, 1500);
+                                return;
+                            }
                             if (data.summary) {
                                 var brief = '## Session Summary\\n\\n' + data.summary;
                                 if (data.topics && data.topics.length > 0) {
@@ -865,7 +1743,8 @@ html = """
                         .catch(function() {
                             addMessage('Session ended. Thank you for chatting!', 'system');
                         });
-                }, 3000);
+                }
+                setTimeout(pollSummary, 1000);
             };
             
             ws.onerror = function(error) {
@@ -912,26 +1791,243 @@ html = """
 </html>
 """
 
+# The chat page never changes at runtime: encode it once and let browsers
+# revalidate with the ETag instead of downloading it again
+_HTML_BYTES = minify_styles(html).encode("utf-8")
+_HTML_ETAG = '"' + hashlib.md5(_HTML_BYTES).hexdigest() + '"'
+_HTML_HEADERS = {"etag": _HTML_ETAG, "cache-control": "public, max-age=300", "vary": "Accept-Encoding"}
+# Compressed once at import (GZipMiddleware leaves already-encoded responses alone).
+# A strong ETag must differ between content-codings, so gzip gets its own tag
+_HTML_GZIP = gzip.compress(_HTML_BYTES, compresslevel=9)
+_HTML_GZIP_ETAG = _HTML_ETAG[:-1] + '-gz"'
+_HTML_GZIP_HEADERS = {**_HTML_HEADERS, "etag": _HTML_GZIP_ETAG, "content-encoding": "gzip"}
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """
+    Whether an Accept-Encoding header allows gzip. An explicit gzip entry
+    decides, otherwise "*" does; a q-value of 0 means "not acceptable".
+    """
+    qualities = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qualities[coding] = q
+    for coding in ("gzip", "x-gzip", "*"):
+        if coding in qualities:
+            return qualities[coding] > 0
+    return False
+
 @app.get("/")
-async def get():
-    return HTMLResponse(html)
+async def get(request: Request):
+    if accepts_gzip(request.headers.get("accept-encoding", "")):
+        content, headers = _HTML_GZIP, _HTML_GZIP_HEADERS
+    else:
+        content, headers = _HTML_BYTES, _HTML_HEADERS
+    if request.headers.get("if-none-match") in (_HTML_ETAG, _HTML_GZIP_ETAG):
+        return Response(status_code=304, headers={k: v for k, v in headers.items() if k != "content-encoding"})
+    return Response(content=content, media_type="text/html; charset=utf-8", headers=headers)
 
-@app.get("/summary/{session_id}")
-async def get_summary_page(session_id: str):
+# Columns of a sessions row that make up its summary
+SESSION_SUMMARY_COLUMNS = (
+    "session_id,status,start_time,end_time,duration_seconds,summary,topics,"
+    "sentiment,metrics,key_outcomes,updated_at"
+)
+# Same without the columns added by later schema migrations, for databases
+# that have not run them yet
+SESSION_SUMMARY_BASE_COLUMNS = (
+    "session_id,status,start_time,end_time,summary,topics,"
+    "sentiment,metrics,key_outcomes"
+)
+
+
+async def select_session_summaries(apply_filter):
+    """
+    Select the summary columns of the sessions rows picked by apply_filter
+    (a function narrowing the query builder). Falls back to
+    SESSION_SUMMARY_BASE_COLUMNS if the migrated columns are missing.
+    """
+    try:
+        return await run_query(apply_filter(supabase.from_("sessions").select(SESSION_SUMMARY_COLUMNS)))
+    except Exception as e:
+        if not is_missing_column_error(e):
+            raise
+        logger.warning("[SUMMARY] sessions table lacks migrated columns, run database/schema.sql: %s", e)
+    return await run_query(apply_filter(supabase.from_("sessions").select(SESSION_SUMMARY_BASE_COLUMNS)))
+
+
+def session_duration_seconds(session_data: dict):
+    """
+    The stored duration_seconds, or (before that column exists) the same
+    value computed from start_time and end_time. None while active.
+    """
+    if 'duration_seconds' in session_data:
+        return session_data['duration_seconds']
+    if not (session_data.get('start_time') and session_data.get('end_time')):
+        return None
+    try:
+        start = parse_timestamp(session_data['start_time'])
+        end = parse_timestamp(session_data['end_time'])
+    except (TypeError, ValueError):
+        return None
+    return int((end - start).total_seconds())
+
+
+def session_summary_payload(session_data: dict) -> dict:
+    """
+    Shape a sessions row (SESSION_SUMMARY_COLUMNS) into the summary returned
+    by the summary APIs. Without updated_at, ETags fall back to hashing the
+    payload and no Last-Modified date is sent.
+    """
+    return {
+        "session_id": session_data.get('session_id'),
+        "status": session_data.get('status'),
+        "start_time": session_data.get('start_time'),
+        "end_time": session_data.get('end_time'),
+        "duration_seconds": session_duration_seconds(session_data),
+        "summary": unwrap_summary_text(session_data.get('summary')),
+        "topics": parse_json_field(session_data.get('topics'), []),
+        "sentiment": session_data.get('sentiment'),
+        "metrics": parse_json_field(session_data.get('metrics'), {}),
+        "key_outcomes": session_data.get('key_outcomes', ''),
+        "updated_at": session_data.get('updated_at')
+    }
+
+
+async def load_session_summary(session_id: str) -> dict:
+    """
+    Load the stored summary of a session, as served by the summary API and
+    embedded in the summary page.
+    """
+    try:
+        session = await select_session_summaries(lambda query: query.eq("session_id", session_id))
+        
+        if not session.data:
+            return {"error": "Session not found"}
+        
+        return session_summary_payload(session.data[0])
+    except Exception as e:
+        return {"error": str(e)}
+
+SENTIMENT_EMOJI = {'positive': '😊', 'neutral': '😐', 'negative': '😟'}
+
+# Metrics shown as stat cards on the summary page, in display order
+SUMMARY_STAT_CARDS = (
+    ('total_messages', 'Total Messages'),
+    ('user_messages', 'Your Messages'),
+    ('ai_messages', 'AI Responses'),
+    ('total_user_words', 'Words Spoken'),
+)
+
+
+def render_summary_html(session_id: str, data: dict) -> str:
     """
-    Display a formatted summary page for a completed session
+    Render the body of the summary page for load_session_summary() data.
+    All stored values are HTML-escaped.
     """
-    summary_html = f"""
+    if data.get('error'):
+        return (
+            f'<div class="error">❌ {escape_html(str(data["error"]))}</div>'
+            '<a href="/" class="back-link">← Back to Chat</a>'
+        )
+    
+    parts = []
+    
+    # Summary section with expand/collapse
+    summary = data.get('summary')
+    if summary:
+        paragraphs = "".join(
+            f'<p>{escape_html(line.strip())}</p>'
+            for line in summary.replace('\\n', '\n').split('\n') if line.strip()
+        )
+        needs_expand = len(summary) > 300
+        parts.append(
+            '<div class="summary-section"><h2>💬 Conversation Summary</h2>'
+            f'<div id="summaryText" class="summary-text summary-content {"collapsed" if needs_expand else ""}">'
+            f'{paragraphs}</div>'
+        )
+        if needs_expand:
+            parts.append('<button class="expand-btn" id="expandBtn" onclick="toggleSummary()">▶ Read full summary</button>')
+        parts.append('</div>')
+    
+    # Topics section
+    topics = data.get('topics')
+    if topics:
+        tags = "".join(f'<span class="topic-tag">{escape_html(str(topic))}</span>' for topic in topics)
+        parts.append(f'<div class="summary-section"><h2>🏷️ Key Topics</h2><div class="topics">{tags}</div></div>')
+    
+    # Key outcomes section
+    if data.get('key_outcomes'):
+        parts.append(
+            '<div class="summary-section"><h2>✨ Key Outcomes</h2>'
+            f'<div class="summary-content"><p>{escape_html(str(data["key_outcomes"]))}</p></div></div>'
+        )
+    
+    # Sentiment section
+    sentiment = data.get('sentiment')
+    if sentiment:
+        sentiment = escape_html(str(sentiment))
+        parts.append(
+            '<div class="summary-section"><h2>🙂 Overall Sentiment</h2>'
+            f'<span class="sentiment sentiment-{sentiment}">{SENTIMENT_EMOJI.get(sentiment, "")} {sentiment}</span></div>'
+        )
+    
+    # Stats section
+    metrics = data.get('metrics')
+    if metrics:
+        cards = "".join(
+            f'<div class="stat-card"><div class="stat-label">{label}</div>'
+            f'<div class="stat-value">{escape_html(str(metrics[key]))}</div></div>'
+            for key, label in SUMMARY_STAT_CARDS if metrics.get(key)
+        )
+        parts.append(f'<div class="summary-section"><h2>📈 Session Statistics</h2><div class="stat-grid">{cards}</div></div>')
+    
+    # Session info
+    status = data.get('status') or 'Completed'
+    info = [
+        ('Session ID', f'{escape_html(session_id[:13])}...'),
+        ('Status', escape_html(status[:1].upper() + status[1:])),
+    ]
+    for key, label in (('start_time', 'Started At'), ('end_time', 'Ended At')):
+        if data.get(key):
+            timestamp = escape_html(str(data[key]))
+            info.append((label, f'<time datetime="{timestamp}">{timestamp}</time>'))
+    # Duration is computed by the database when the session ends
+    if data.get('duration_seconds') is not None:
+        info.append(('Duration', f'{data["duration_seconds"] // 60} minutes'))
+    items = "".join(
+        f'<div class="session-info-item"><span class="session-info-label">{label}</span><span>{value}</span></div>'
+        for label, value in info
+    )
+    parts.append(f'<div class="summary-section"><h2>ℹ️ Session Details</h2><div class="session-info-grid">{items}</div></div>')
+    
+    # Add back link
+    parts.append('<div style="text-align: center; margin-top: 40px;"><a href="/" class="back-link">← Start New Chat</a></div>')
+    
+    return "".join(parts)
+
+# Summary page template. Plain string with {{PLACEHOLDER}} markers (no f-string),
+# minified and encoded once; the handler only substitutes the session id and
+# rendered summary.
+SUMMARY_PAGE_TEMPLATE = minify_styles("""
 <!DOCTYPE html>
 <html>
     <head>
-        <title>Session Summary - {session_id[:8]}</title>
-        <script src="https://cdn.jsdelivr.net/npm/marked/marked.min.js"></script>
+        <title>Session Summary - {{SESSION_SHORT}}</title>
         <style>
-            * {{
+            * {
                 box-sizing: border-box;
-            }}
-            body {{
+            }
+            body {
                 font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, Oxygen, Ubuntu, Cantarell, sans-serif;
                 max-width: 1200px;
                 margin: 0 auto;
@@ -939,62 +2035,47 @@ async def get_summary_page(session_id: str):
                 background: #f5f7fa;
                 min-height: 100vh;
                 line-height: 1.6;
-            }}
-            .container {{
+            }
+            .container {
                 background: white;
                 border-radius: 12px;
                 box-shadow: 0 2px 12px rgba(0,0,0,0.08);
                 padding: 40px;
                 margin-bottom: 20px;
-            }}
-            h1 {{
+            }
+            h1 {
                 color: #1a202c;
                 font-size: 28px;
                 font-weight: 700;
                 margin-bottom: 10px;
                 margin-top: 0;
-            }}
-            .subtitle {{
+            }
+            .subtitle {
                 color: #718096;
                 font-size: 14px;
                 margin-bottom: 30px;
-            }}
-            .loading {{
-                text-align: center;
-                padding: 60px 40px;
-                color: #718096;
-                font-size: 16px;
-            }}
-            .loading::after {{
-                content: '...';
-                animation: dots 1.5s infinite;
-            }}
-            @keyframes dots {{
-                0%, 20% {{ content: '.'; }}
-                40% {{ content: '..'; }}
-                60%, 100% {{ content: '...'; }}
-            }}
-            .error {{
+            }
+            .error {
                 background: #fff5f5;
                 border: 1px solid #fc8181;
                 border-left: 4px solid #f56565;
                 padding: 20px;
                 border-radius: 8px;
                 color: #742a2a;
-            }}
-            .summary-section {{
+            }
+            .summary-section {
                 margin-bottom: 24px;
                 padding: 24px;
                 background: #fafbfc;
                 border-radius: 8px;
                 border: 1px solid #e2e8f0;
                 transition: all 0.2s;
-            }}
-            .summary-section:hover {{
+            }
+            .summary-section:hover {
                 border-color: #cbd5e0;
                 box-shadow: 0 2px 8px rgba(0,0,0,0.05);
-            }}
-            .summary-section h2 {{
+            }
+            .summary-section h2 {
                 margin-top: 0;
                 margin-bottom: 16px;
                 color: #2d3748;
@@ -1003,20 +2084,20 @@ async def get_summary_page(session_id: str):
                 display: flex;
                 align-items: center;
                 gap: 8px;
-            }}
-            .summary-content {{
+            }
+            .summary-content {
                 color: #4a5568;
                 font-size: 15px;
                 line-height: 1.7;
-            }}
-            .summary-text {{
+            }
+            .summary-text {
                 position: relative;
-            }}
-            .summary-text.collapsed {{
+            }
+            .summary-text.collapsed {
                 max-height: 150px;
                 overflow: hidden;
-            }}
-            .summary-text.collapsed::after {{
+            }
+            .summary-text.collapsed::after {
                 content: '';
                 position: absolute;
                 bottom: 0;
@@ -1024,8 +2105,8 @@ async def get_summary_page(session_id: str):
                 right: 0;
                 height: 60px;
                 background: linear-gradient(transparent, #fafbfc);
-            }}
-            .expand-btn {{
+            }
+            .expand-btn {
                 background: none;
                 border: none;
                 color: #5a67d8;
@@ -1037,49 +2118,49 @@ async def get_summary_page(session_id: str):
                 display: inline-flex;
                 align-items: center;
                 gap: 4px;
-            }}
-            .expand-btn:hover {{
+            }
+            .expand-btn:hover {
                 color: #4c51bf;
                 text-decoration: underline;
-            }}
-            .stat-grid {{
+            }
+            .stat-grid {
                 display: grid;
                 grid-template-columns: repeat(auto-fit, minmax(160px, 1fr));
                 gap: 16px;
                 margin-top: 16px;
-            }}
-            .stat-card {{
+            }
+            .stat-card {
                 background: white;
                 padding: 20px;
                 border-radius: 8px;
                 border: 1px solid #e2e8f0;
                 text-align: center;
                 transition: transform 0.2s, box-shadow 0.2s;
-            }}
-            .stat-card:hover {{
+            }
+            .stat-card:hover {
                 transform: translateY(-2px);
                 box-shadow: 0 4px 12px rgba(0,0,0,0.1);
-            }}
-            .stat-value {{
+            }
+            .stat-value {
                 font-size: 28px;
                 font-weight: 700;
                 color: #5a67d8;
                 margin: 8px 0;
-            }}
-            .stat-label {{
+            }
+            .stat-label {
                 color: #718096;
                 font-size: 13px;
                 font-weight: 500;
                 text-transform: uppercase;
                 letter-spacing: 0.5px;
-            }}
-            .topics {{
+            }
+            .topics {
                 display: flex;
                 flex-wrap: wrap;
                 gap: 8px;
                 margin-top: 12px;
-            }}
-            .topic-tag {{
+            }
+            .topic-tag {
                 background: #edf2f7;
                 color: #2d3748;
                 padding: 6px 14px;
@@ -1087,8 +2168,8 @@ async def get_summary_page(session_id: str):
                 font-size: 13px;
                 font-weight: 500;
                 border: 1px solid #e2e8f0;
-            }}
-            .sentiment {{
+            }
+            .sentiment {
                 display: inline-flex;
                 align-items: center;
                 padding: 8px 16px;
@@ -1096,83 +2177,83 @@ async def get_summary_page(session_id: str):
                 font-weight: 600;
                 font-size: 14px;
                 text-transform: capitalize;
-            }}
-            .sentiment-positive {{ background: #c6f6d5; color: #22543d; }}
-            .sentiment-neutral {{ background: #bee3f8; color: #2c5282; }}
-            .sentiment-negative {{ background: #fed7d7; color: #742a2a; }}
-            .session-info-grid {{
+            }
+            .sentiment-positive { background: #c6f6d5; color: #22543d; }
+            .sentiment-neutral { background: #bee3f8; color: #2c5282; }
+            .sentiment-negative { background: #fed7d7; color: #742a2a; }
+            .session-info-grid {
                 display: grid;
                 gap: 12px;
                 color: #4a5568;
                 font-size: 14px;
-            }}
-            .session-info-item {{
+            }
+            .session-info-item {
                 display: flex;
                 padding: 8px 0;
                 border-bottom: 1px solid #e2e8f0;
-            }}
-            .session-info-item:last-child {{
+            }
+            .session-info-item:last-child {
                 border-bottom: none;
-            }}
-            .session-info-label {{
+            }
+            .session-info-label {
                 font-weight: 600;
                 color: #2d3748;
                 min-width: 120px;
-            }}
-            .rating-section {{
+            }
+            .rating-section {
                 background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
                 color: white;
                 padding: 32px;
                 border-radius: 12px;
                 text-align: center;
                 margin-top: 32px;
-            }}
-            .rating-section h2 {{
+            }
+            .rating-section h2 {
                 color: white;
                 margin-top: 0;
                 margin-bottom: 16px;
                 font-size: 22px;
-            }}
-            .rating-section p {{
+            }
+            .rating-section p {
                 opacity: 0.95;
                 margin-bottom: 24px;
-            }}
-            .rating-stars {{
+            }
+            .rating-stars {
                 display: flex;
                 justify-content: center;
                 gap: 12px;
                 margin-bottom: 20px;
-            }}
-            .star {{
+            }
+            .star {
                 font-size: 36px;
                 cursor: pointer;
                 transition: all 0.2s;
                 filter: grayscale(100%);
                 opacity: 0.5;
-            }}
+            }
             .star:hover,
-            .star.selected {{
+            .star.selected {
                 filter: grayscale(0%);
                 opacity: 1;
                 transform: scale(1.2);
-            }}
-            .rating-feedback {{
+            }
+            .rating-feedback {
                 margin-top: 16px;
                 padding: 12px 20px;
                 background: rgba(255,255,255,0.2);
                 border-radius: 8px;
                 font-weight: 500;
                 display: none;
-            }}
-            .rating-feedback.show {{
+            }
+            .rating-feedback.show {
                 display: block;
                 animation: fadeIn 0.3s;
-            }}
-            @keyframes fadeIn {{
-                from {{ opacity: 0; transform: translateY(-10px); }}
-                to {{ opacity: 1; transform: translateY(0); }}
-            }}
-            .back-link {{
+            }
+            @keyframes fadeIn {
+                from { opacity: 0; transform: translateY(-10px); }
+                to { opacity: 1; transform: translateY(0); }
+            }
+            .back-link {
                 display: inline-block;
                 margin-top: 24px;
                 padding: 12px 32px;
@@ -1183,300 +2264,146 @@ async def get_summary_page(session_id: str):
                 font-weight: 600;
                 border: 2px solid #e2e8f0;
                 transition: all 0.2s;
-            }}
-            .back-link:hover {{
+            }
+            .back-link:hover {
                 background: #5a67d8;
                 color: white;
                 border-color: #5a67d8;
                 transform: translateY(-2px);
                 box-shadow: 0 4px 12px rgba(90, 103, 216, 0.3);
-            }}
-            .conversation {{
+            }
+            .conversation {
                 margin-top: 20px;
                 max-height: 400px;
                 overflow-y: auto;
                 background: white;
                 padding: 20px;
                 border-radius: 8px;
-            }}
-            .conv-message {{
+            }
+            .conv-message {
                 margin-bottom: 15px;
                 padding: 10px;
                 border-radius: 6px;
-            }}
-            .conv-user {{
+            }
+            .conv-user {
                 background: #e3f2fd;
                 border-left: 3px solid #2196f3;
-            }}
-            .conv-ai {{
+            }
+            .conv-ai {
                 background: #f5f5f5;
                 border-left: 3px solid #4caf50;
-            }}
-            .conv-label {{
+            }
+            .conv-label {
                 font-weight: bold;
                 font-size: 12px;
                 text-transform: uppercase;
                 color: #666;
                 margin-bottom: 5px;
-            }}
+            }
         </style>
     </head>
     <body>
         <div class="container">
             <h1>📊 Session Complete</h1>
             <div class="subtitle">Here's a comprehensive summary of your conversation</div>
-            <div id="content" class="loading">
-                Loading session summary
-            </div>
+            <div id="content">{{CONTENT}}</div>
         </div>
         <script>
-            const sessionId = '{session_id}';
-            
-            function formatSummary(text) {{
-                // Clean up any JSON formatting
-                if (!text) return '';
-                
-                // If it looks like JSON, try to parse it
-                if (text.trim().startsWith('{{')) {{
-                    try {{
-                        const parsed = JSON.parse(text);
-                        text = parsed.summary || parsed.text || text;
-                    }} catch(e) {{
-                        // Not valid JSON, use as is
-                        console.log('Could not parse as JSON:', e);
-                    }}
-                }}
-                
-                // Convert to proper paragraphs
-                return text
-                    .replace(/\\\\n/g, '\\n')
-                    .split('\\n')
-                    .filter(p => p.trim())
-                    .map(p => '<p>' + p.trim() + '</p>')
-                    .join('');
-            }}
-            
-            function toggleSummary() {{
+            function toggleSummary() {
                 const summaryText = document.getElementById('summaryText');
                 const expandBtn = document.getElementById('expandBtn');
                 
-                if (summaryText.classList.contains('collapsed')) {{
+                if (summaryText.classList.contains('collapsed')) {
                     summaryText.classList.remove('collapsed');
                     expandBtn.textContent = '▼ Show less';
-                }} else {{
+                } else {
                     summaryText.classList.add('collapsed');
                     expandBtn.textContent = '▶ Read full summary';
-                }}
-            }}
+                }
+            }
             
-            console.log('Fetching summary for session:', sessionId);
-            fetch('/api/session/' + sessionId + '/summary')
-                .then(response => {{
-                    console.log('Response received:', response.status);
-                    return response.json();
-                }})
-                .then(data => {{
-                    console.log('Summary data:', data);
-                    if (data.error) {{
-                        console.error('Error in response:', data.error);
-                        document.getElementById('content').innerHTML = 
-                            '<div class="error">❌ ' + data.error + '</div>' +
-                            '<a href="/" class="back-link">← Back to Chat</a>';
-                        return;
-                    }}
-                    
-                    let html = '';
-                    
-                    // Summary section with expand/collapse
-                    if (data.summary) {{
-                        const formattedSummary = formatSummary(data.summary);
-                        const needsExpand = data.summary.length > 300;
-                        
-                        html += '<div class="summary-section">';
-                        html += '<h2>💬 Conversation Summary</h2>';
-                        html += '<div id="summaryText" class="summary-text summary-content ' + (needsExpand ? 'collapsed' : '') + '">';
-                        html += formattedSummary;
-                        html += '</div>';
-                        
-                        if (needsExpand) {{
-                            html += '<button class="expand-btn" id="expandBtn" onclick="toggleSummary()">▶ Read full summary</button>';
-                        }}
-                        
-                        html += '</div>';
-                    }}
-                    
-                    // Topics section
-                    if (data.topics && data.topics.length > 0) {{
-                        html += '<div class="summary-section">';
-                        html += '<h2>🏷️ Key Topics</h2>';
-                        html += '<div class="topics">';
-                        data.topics.forEach(topic => {{
-                            html += '<span class="topic-tag">' + topic + '</span>';
-                        }});
-                        html += '</div></div>';
-                    }}
-                    
-                    // Key outcomes section
-                    if (data.key_outcomes) {{
-                        html += '<div class="summary-section">';
-                        html += '<h2>✨ Key Outcomes</h2>';
-                        html += '<div class="summary-content">';
-                        html += '<p>' + data.key_outcomes + '</p>';
-                        html += '</div></div>';
-                    }}
-                    
-                    // Sentiment section
-                    if (data.sentiment) {{
-                        html += '<div class="summary-section">';
-                        html += '<h2>� Overall Sentiment</h2>';
-                        const sentimentEmoji = {{
-                            'positive': '😊',
-                            'neutral': '😐',
-                            'negative': '😟'
-                        }};
-                        const sentimentClass = 'sentiment sentiment-' + data.sentiment;
-                        html += '<span class="' + sentimentClass + '">';
-                        html += (sentimentEmoji[data.sentiment] || '') + ' ' + data.sentiment;
-                        html += '</span>';
-                        html += '</div>';
-                    }}
-                    
-                    // Stats section
-                    if (data.metrics) {{
-                        html += '<div class="summary-section">';
-                        html += '<h2>� Session Statistics</h2>';
-                        html += '<div class="stat-grid">';
-                        
-                        if (data.metrics.total_messages) {{
-                            html += '<div class="stat-card">';
-                            html += '<div class="stat-label">Total Messages</div>';
-                            html += '<div class="stat-value">' + data.metrics.total_messages + '</div>';
-                            html += '</div>';
-                        }}
-                        
-                        if (data.metrics.user_messages) {{
-                            html += '<div class="stat-card">';
-                            html += '<div class="stat-label">Your Messages</div>';
-                            html += '<div class="stat-value">' + data.metrics.user_messages + '</div>';
-                            html += '</div>';
-                        }}
-                        
-                        if (data.metrics.ai_messages) {{
-                            html += '<div class="stat-card">';
-                            html += '<div class="stat-label">AI Responses</div>';
-                            html += '<div class="stat-value">' + data.metrics.ai_messages + '</div>';
-                            html += '</div>';
-                        }}
-                        
-                        if (data.metrics.total_user_words) {{
-                            html += '<div class="stat-card">';
-                            html += '<div class="stat-label">Words Spoken</div>';
-                            html += '<div class="stat-value">' + data.metrics.total_user_words + '</div>';
-                            html += '</div>';
-                        }}
-                        
-                        html += '</div></div>';
-                    }}
-                    
-                    // Session info
-                    html += '<div class="summary-section">';
-                    html += '<h2>ℹ️ Session Details</h2>';
-                    html += '<div class="session-info-grid">';
-                    
-                    html += '<div class="session-info-item">';
-                    html += '<span class="session-info-label">Session ID</span>';
-                    html += '<span>' + sessionId.substring(0, 13) + '...</span>';
-                    html += '</div>';
-                    
-                    html += '<div class="session-info-item">';
-                    html += '<span class="session-info-label">Status</span>';
-                    html += '<span>' + (data.status || 'Completed').charAt(0).toUpperCase() + (data.status || 'Completed').slice(1) + '</span>';
-                    html += '</div>';
-                    
-                    if (data.start_time) {{
-                        html += '<div class="session-info-item">';
-                        html += '<span class="session-info-label">Started At</span>';
-                        html += '<span>' + new Date(data.start_time).toLocaleString() + '</span>';
-                        html += '</div>';
-                    }}
-                    
-                    if (data.end_time) {{
-                        html += '<div class="session-info-item">';
-                        html += '<span class="session-info-label">Ended At</span>';
-                        html += '<span>' + new Date(data.end_time).toLocaleString() + '</span>';
-                        html += '</div>';
-                    }}
-                    
-                    // Calculate duration
-                    if (data.start_time && data.end_time) {{
-                        const duration = Math.floor((new Date(data.end_time) - new Date(data.start_time)) / 60000);
-                        html += '<div class="session-info-item">';
-                        html += '<span class="session-info-label">Duration</span>';
-                        html += '<span>' + duration + ' minutes</span>';
-                        html += '</div>';
-                    }}
-                    
-                    html += '</div></div>';
-                    
-                    // Add back link
-                    html += '<div style="text-align: center; margin-top: 40px;">';
-                    html += '<a href="/" class="back-link">← Start New Chat</a>';
-                    html += '</div>';
-                    
-                    document.getElementById('content').innerHTML = html;
-                }})
-                .catch(error => {{
-                    console.error('Fetch error:', error);
-                    document.getElementById('content').innerHTML = 
-                        '<div class="error">❌ Failed to load summary: ' + error + '</div>' +
-                        '<p>Please check the console for more details.</p>' +
-                        '<a href="/" class="back-link">← Back to Chat</a>';
-                }});
+            // Timestamps are rendered by the server as ISO strings; show them in local time
+            document.querySelectorAll('time[datetime]').forEach(el => {
+                el.textContent = new Date(el.dateTime).toLocaleString();
+            });
         </script>
     </body>
 </html>
-"""
-    return HTMLResponse(summary_html)
+""").encode("utf-8")
+
+@app.get("/summary/{session_id}")
+async def get_summary_page(session_id: str):
+    """
+    Display a formatted summary page for a completed session.
+
+    The summary is rendered into the page on the server, so the browser does
+    not need a second request to /api/session/{session_id}/summary or any
+    script to build the markup.
+    """
+    data = await load_session_summary(session_id)
+    page = (
+        SUMMARY_PAGE_TEMPLATE
+        .replace(b"{{SESSION_SHORT}}", escape_html(session_id[:8]).encode("utf-8"))
+        .replace(b"{{CONTENT}}", render_summary_html(session_id, data).encode("utf-8"))
+    )
+    return Response(content=page, media_type="text/html; charset=utf-8")
+
+def summary_etag(data: dict) -> str:
+    """
+    ETag for a session summary. updated_at is bumped by a trigger on every
+    change to the sessions row; without it, fall back to hashing the payload.
+    """
+    if data.get('updated_at'):
+        tag = f"{data['session_id']}|{data['updated_at']}".encode("utf-8")
+    else:
+        tag = orjson.dumps(data)
+    return '"' + hashlib.md5(tag).hexdigest() + '"'
+
+def summary_not_modified(request: Request, etag: str, last_modified) -> bool:
+    """
+    Whether the client's cached copy is still current. If-None-Match takes
+    precedence; If-Modified-Since is compared at the one-second resolution of
+    HTTP dates.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return if_none_match == etag
+    if_modified_since = request.headers.get("if-modified-since")
+    if not if_modified_since or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=UTC)
+    return last_modified.replace(microsecond=0) <= since
 
 @app.get("/api/session/{session_id}/summary")
-async def get_session_summary(session_id: str):
+async def get_session_summary(session_id: str, request: Request, response: Response):
     """
     Get the summary of a completed session.
+
+    Responses carry an ETag and a Last-Modified date and must be revalidated
+    (sessions can be reopened), so repeated polls of an unchanged session get
+    a bodyless 304.
     """
-    try:
-        session = supabase.from_("sessions").select("*").eq("session_id", session_id).execute()
-        
-        if not session.data:
-            return {"error": "Session not found"}
-        
-        session_data = session.data[0]
-        
-        # Parse JSON fields if they exist
-        if session_data.get('topics'):
-            try:
-                session_data['topics'] = json.loads(session_data['topics'])
-            except:
-                pass
-        
-        if session_data.get('metrics'):
-            try:
-                session_data['metrics'] = json.loads(session_data['metrics'])
-            except:
-                pass
-        
-        return {
-            "session_id": session_id,
-            "status": session_data.get('status'),
-            "start_time": session_data.get('start_time'),
-            "end_time": session_data.get('end_time'),
-            "summary": session_data.get('summary'),
-            "topics": session_data.get('topics', []),
-            "sentiment": session_data.get('sentiment'),
-            "metrics": session_data.get('metrics', {}),
-            "key_outcomes": session_data.get('key_outcomes', '')
-        }
-    except Exception as e:
-        return {"error": str(e)}
+    data = await load_session_summary(session_id)
+    if "error" in data:
+        return data
+    
+    headers = {"etag": summary_etag(data), "cache-control": "no-cache"}
+    last_modified = None
+    if data.get('updated_at'):
+        try:
+            last_modified = parse_timestamp(data['updated_at']).astimezone(UTC)
+            headers["last-modified"] = format_datetime(last_modified, usegmt=True)
+        except ValueError:
+            pass
+    if summary_not_modified(request, headers["etag"], last_modified):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return data
 
 @app.post("/api/session/{session_id}/rate")
 async def rate_session(session_id: str, rating_data: dict):
@@ -1490,10 +2417,11 @@ async def rate_session(session_id: str, rating_data: dict):
             return {"error": "Rating must be between 1 and 5"}
         
         # Update session with rating
-        result = supabase.from_("sessions").update({
+        result = await run_query(supabase.from_("sessions").update({
             "user_rating": rating,
-            "rated_at": datetime.utcnow().isoformat()
-        }).eq("session_id", session_id).execute()
+            "rated_at": utc_now_iso()
+        }).eq("session_id", session_id))
+        invalidate_session_lists()
         
         return {
             "success": True,
@@ -1502,33 +2430,55 @@ async def rate_session(session_id: str, rating_data: dict):
             "message": "Thank you for your feedback!"
         }
     except Exception as e:
-        print(f"Error saving rating: {e}")
+        logger.error("Error saving rating: %s", e)
         return {"error": str(e), "success": False}
 
+MAX_SESSIONS_PAGE_SIZE = 100
+
 @app.get("/api/sessions")
-async def list_sessions():
+async def list_sessions(limit: int = 20, after: str = None, after_id: str = None):
     """
-    List all sessions with their summaries.
+    List sessions with their summaries, newest first.
+
+    Pages hold `limit` sessions (at most MAX_SESSIONS_PAGE_SIZE). To get the
+    next page, pass the previous response's `next_after` and `next_after_id`
+    as `after` and `after_id`; sessions are ordered by (start_time,
+    session_id) so ones that started at the same instant are not skipped.
     """
     try:
-        sessions = supabase.from_("sessions").select("*").order("start_time", desc=True).limit(50).execute()
+        limit = max(1, min(limit, MAX_SESSIONS_PAGE_SIZE))
+        if after:
+            try:
+                after = parse_timestamp(after).isoformat()
+            except (ValueError, TypeError):
+                return ORJSONResponse(status_code=422, content={"error": "after must be an ISO-8601 timestamp"})
+        if after_id:
+            try:
+                after_id = str(uuid.UUID(after_id))
+            except ValueError:
+                return ORJSONResponse(status_code=422, content={"error": "after_id must be a session id"})
+        cache_key = ("sessions_page", _session_list_generation, limit, after, after_id)
+        cached = cache_get(cache_key)
+        if cached is not None:
+            return cached
+        
+        query = (
+            supabase.from_("sessions")
+            .select("session_id,status,start_time,end_time,summary,topics,sentiment,metrics")
+            .order("start_time", desc=True).order("session_id", desc=True).limit(limit)
+        )
+        if after and after_id:
+            query = query.or_(
+                f'start_time.lt."{after}",and(start_time.eq."{after}",session_id.lt."{after_id}")'
+            )
+        elif after:
+            query = query.lt("start_time", after)
+        sessions = await run_query(query)
         
         result = []
         for session in sessions.data:
-            # Parse JSON fields
-            topics = session.get('topics')
-            if topics:
-                try:
-                    topics = json.loads(topics)
-                except:
-                    topics = []
-            
-            metrics = session.get('metrics')
-            if metrics:
-                try:
-                    metrics = json.loads(metrics)
-                except:
-                    metrics = {}
+            topics = parse_json_field(session.get('topics'), [])
+            metrics = parse_json_field(session.get('metrics'), {})
             
             result.append({
                 "session_id": session.get('session_id'),
@@ -1541,7 +2491,38 @@ async def list_sessions():
                 "message_count": metrics.get('total_messages', 0) if metrics else 0
             })
         
-        return {"sessions": result, "count": len(result)}
+        last = result[-1] if len(result) == limit else None
+        page = {
+            "sessions": result,
+            "count": len(result),
+            "next_after": last["start_time"] if last else None,
+            "next_after_id": last["session_id"] if last else None,
+        }
+        cache_set(cache_key, page, ttl=SESSIONS_LIST_CACHE_TTL_SECONDS)
+        return page
+    except Exception as e:
+        return {"error": str(e)}
+
+@app.post("/api/sessions/summaries")
+async def get_session_summaries(request_data: dict):
+    """
+    Get the summaries of several sessions in one request.
+
+    Expects {"ids": [...]} with at most MAX_SESSIONS_PAGE_SIZE session ids and
+    returns {"summaries": {session_id: summary}}; unknown ids are left out.
+    """
+    try:
+        ids = request_data.get('ids') or []
+        if not isinstance(ids, list):
+            return {"error": "ids must be a list of session ids"}
+        if len(ids) > MAX_SESSIONS_PAGE_SIZE:
+            return {"error": f"At most {MAX_SESSIONS_PAGE_SIZE} ids per request"}
+        if not ids:
+            return {"summaries": {}}
+        
+        sessions = await select_session_summaries(lambda query: query.in_("session_id", ids))
+        summaries = {row['session_id']: session_summary_payload(row) for row in sessions.data}
+        return {"summaries": summaries}
     except Exception as e:
         return {"error": str(e)}
 
@@ -1552,24 +2533,24 @@ async def regenerate_summary(session_id: str):
     Useful for testing and reprocessing sessions.
     """
     try:
-        # Check if session exists
-        session = supabase.from_("sessions").select("*").eq("session_id", session_id).execute()
-        
-        if not session.data:
-            return {"error": "Session not found"}
-        
-        # Generate new summary
-        summary_result = await generate_session_summary(session_id)
+        # Generate new summary (a missing session has no logs, so this is cheap
+        # and never reaches the model)
+        summary_result = await generate_session_summary(session_id, use_cache=False)
         
         # Update session
         update_data = {
-            "summary": summary_result.get("summary", ""),
-            "topics": json.dumps(summary_result.get("topics", [])),
+            "summary": unwrap_summary_text(summary_result.get("summary", "")),
+            "topics": summary_result.get("topics", []),
             "sentiment": summary_result.get("sentiment", "neutral"),
-            "metrics": json.dumps(summary_result.get("metrics", {})),
+            "metrics": summary_result.get("metrics", {}),
         }
         
-        supabase.from_("sessions").update(update_data).eq("session_id", session_id).execute()
+        # The update doubles as the existence check: no row updated, no session
+        result = await run_query(supabase.from_("sessions").update(update_data).eq("session_id", session_id))
+        if not result.data:
+            return {"error": "Session not found"}
+        cache_invalidate(("session", session_id))
+        invalidate_session_lists()
         
         return {
             "success": True,
@@ -1586,7 +2567,7 @@ async def health_check():
     """
     try:
         # Test database connection
-        test_query = supabase.from_("sessions").select("session_id").limit(1).execute()
+        test_query = await run_query(supabase.from_("sessions").select("session_id").limit(1))
         db_status = "healthy"
     except Exception as e:
         db_status = f"unhealthy: {str(e)}"
@@ -1595,7 +2576,7 @@ async def health_check():
         "status": "running",
         "database": db_status,
         "model": "llama-3.1-8b-instant",
-        "timestamp": datetime.utcnow().isoformat()
+        "timestamp": utc_now_iso()
     }
 
 @app.websocket("/ws/session/{session_id}")
@@ -1605,95 +2586,100 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
     # Check if session exists, if not create it - MUST succeed before proceeding
     session_ready = False
     try:
-        existing_session = supabase.from_("sessions").select("*").eq("session_id", session_id).execute()
+        existing_session = await run_query(supabase.from_("sessions").select("session_id").eq("session_id", session_id))
         if not existing_session.data:
             # Create new session
-            result = supabase.from_("sessions").insert([{
+            result = await run_query(supabase.from_("sessions").insert([{
                 "session_id": session_id,
                 "user_id": "placeholder_user",
                 "status": "active",
-                "start_time": datetime.utcnow().isoformat()
-            }]).execute()
-            print(f"New session created: {session_id}")
+                "start_time": utc_now_iso()
+            }]))
+            invalidate_session_lists()
+            logger.info("New session created: %s", session_id)
             session_ready = True
         else:
             # Update session to active if reconnecting
-            supabase.from_("sessions").update({
+            await run_query(supabase.from_("sessions").update({
                 "status": "active"
-            }).eq("session_id", session_id).execute()
-            print(f"Session reconnected: {session_id}")
+            }).eq("session_id", session_id))
+            cache_invalidate(("session", session_id))
+            invalidate_session_lists()
+            logger.info("Session reconnected: %s", session_id)
             session_ready = True
     except Exception as e:
-        print(f"Error checking/creating session: {e}")
+        logger.error("Error checking/creating session: %s", e)
         await websocket.send_text(f"Error: Could not initialize session. {str(e)}")
         await websocket.close()
         return
     
     # Only proceed if session was successfully initialized
     if not session_ready:
-        print(f"Session not ready, closing connection")
+        logger.warning("Session not ready, closing connection")
         return
     
+    # Conversation memory for this connection. A new session starts empty; a
+    # reopened one is loaded from session_logs once, not on every message
+    history = deque(maxlen=HISTORY_MAX_MESSAGES)
+    if existing_session.data:
+        logger.debug("[MEMORY] Loading conversation history for session: %s", session_id)
+        try:
+            history = await load_history(session_id)
+            logger.debug("[MEMORY] Found %d previous messages", len(history))
+        except Exception as e:
+            logger.error("[MEMORY] Error fetching history: %s", e)
+    
     try:
         while True:
             data = await websocket.receive_text()
             
-            # Log user message
-            try:
-                supabase.from_("session_logs").insert([{
-                    "session_id": session_id,
-                    "event_type": "user",
-                    "message": data
-                }]).execute()
-            except Exception as e:
-                print(f"Error logging user message: {e}")
-                print(f"Session ID: {session_id}, Message: {data[:50]}")
+            # Log user message (written by the background log writer)
+            enqueue_log(session_id, "user", data)
             
             # ============================================================
             # STEP 1: DETECT INTENT (Multi-Step Routing)
             # ============================================================
             intent = detect_intent(data)
             selected_prompt = get_system_prompt_for_intent(intent)
-            print(f"[INTENT] Detected intent: {intent}")
-            
-            # Send intent notification to user (optional, for demo purposes)
-            intent_names = {
-                'technical_support': '🔧 Technical Support Mode',
-                'code_assistant': '💻 Code Assistant Mode',
-                'tutorial': '📚 Tutorial Mode',
-                'casual_chat': '💬 Chat Mode'
-            }
-            await websocket.send_text(f"[{intent_names.get(intent, 'Chat')}]\n")
+            logger.debug("[INTENT] Detected intent: %s", intent)
             
             # ============================================================
             # STEP 2: CHECK IF TOOL IS NEEDED (Function Calling)
             # ============================================================
             should_use, tool_name, tool_params = should_use_tool(data, session_id)
             
-            tool_result = None
+            tool_task = None
             if should_use:
-                print(f"[TOOL] Tool needed: {tool_name}")
-                await websocket.send_text(f"🔍 Fetching data using {tool_name}...\n")
-                
-                # Execute the tool
-                tool_result = await execute_tool(tool_name, tool_params)
-                print(f"[TOOL] Tool result: {tool_result}")
-                
-                # Send tool result to user (optional, for transparency)
-                await websocket.send_text(f"✅ Data retrieved successfully!\n\n")
+                logger.debug("[TOOL] Tool needed: %s", tool_name)
+                # Start the log flush and the tool now, so they run while the
+                # status lines below are being sent
+                tool_task = asyncio.create_task(flush_and_execute_tool(tool_name, tool_params))
+            
+            try:
+                # Send intent notification to user (optional, for demo purposes)
+                await websocket.send_text(f"[{INTENT_NAMES.get(intent, 'Chat')}]\n")
+                if tool_task:
+                    await websocket.send_text(f"🔍 Fetching data using {tool_name}...\n")
+            except BaseException:
+                # Client went away: don't leave the tool running unobserved
+                if tool_task:
+                    tool_task.cancel()
+                raise
             
             # ============================================================
-            # STEP 3: FETCH CONVERSATION HISTORY (Memory)
+            # STEP 3: SELECT CONVERSATION HISTORY (Memory)
             # ============================================================
-            print(f"[MEMORY] Fetching conversation history for session: {session_id}")
-            try:
-                # Get previous messages from this session
-                # Limit to last 20 messages (10 exchanges) to prevent context overflow
-                history = supabase.from_("session_logs").select("*").eq("session_id", session_id).order("id", desc=False).limit(20).execute()
-                print(f"[MEMORY] Found {len(history.data) if history.data else 0} previous messages")
-            except Exception as e:
-                print(f"[MEMORY] Error fetching history: {e}")
-                history = None
+            # The most recent messages that fit the token budget
+            previous = history_messages(history)
+            history.append(("human", data))
+            
+            tool_result = None
+            if tool_task:
+                tool_result = await tool_task
+                logger.debug("[TOOL] Tool result: %s", tool_result)
+                
+                # Send tool result to user (optional, for transparency)
+                await websocket.send_text(f"✅ Data retrieved successfully!\n\n")
             
             # ============================================================
             # STEP 4: BUILD CONTEXT WITH TOOL RESULTS AND HISTORY
@@ -1702,14 +2688,8 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
             messages = [("system", selected_prompt)]
             
             # Add conversation history (previous messages)
-            if history and history.data:
-                # Add all previous messages to maintain context
-                for log in history.data:
-                    if log['event_type'] == 'user':
-                        messages.append(("human", log['message']))
-                    elif log['event_type'] == 'ai':
-                        messages.append(("assistant", log['message']))
-                print(f"[MEMORY] Added {len(history.data)} messages to context")
+            messages.extend(previous)
+            logger.debug("[MEMORY] Added %d messages to context", len(previous))
             
             # Add current message (with tool results if any)
             if tool_result:
@@ -1717,7 +2697,7 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
                 current_message_with_context = f"""User query: {data}
 
 I retrieved the following data using the {tool_name} function:
-{json.dumps(tool_result, indent=2)}
+{orjson.dumps(tool_result).decode()}
 
 Please use this data to answer the user's question in a natural, conversational way. 
 Don't just repeat the raw data - interpret it and present it in a user-friendly format."""
@@ -1726,64 +2706,42 @@ Don't just repeat the raw data - interpret it and present it in a user-friendly
                 # Just add the current message
                 messages.append(("human", data))
             
-            print(f"[MEMORY] Total messages in context: {len(messages)}")
+            logger.debug("[MEMORY] Total messages in context: %d", len(messages))
             
             # ============================================================
             # STEP 5: GENERATE AI RESPONSE WITH FULL CONVERSATION HISTORY
             # ============================================================
-            full_response = ""
+            response_parts = []
             try:
                 
-                for chunk in model.stream(messages):
-                    if hasattr(chunk, 'content'):
-                        token = chunk.content
-                        full_response += token
-                        await websocket.send_text(token)
+                # Stream without blocking the event loop, one frame per ~20 ms of tokens
+                async with aclosing(coalesce_tokens(get_model().astream(messages))) as stream:
+                    async for text in stream:
+                        response_parts.append(text)
+                        await websocket.send_text(text)
+                full_response = "".join(response_parts)
                 
-                # Log the complete AI response
+                # Log the complete AI response (written by the background log writer)
                 if full_response:
-                    # Try to log with metadata, fall back without it if column doesn't exist
-                    try:
-                        supabase.from_("session_logs").insert([{
-                            "session_id": session_id,
-                            "event_type": "ai",
-                            "message": full_response,
-                            "metadata": json.dumps({
-                                "intent": intent,
-                                "tool_used": tool_name if should_use else None
-                            })
-                        }]).execute()
-                    except Exception as metadata_error:
-                        # If metadata column doesn't exist, log without it
-                        print(f"[LOG] Metadata column not found, logging without it: {metadata_error}")
-                        supabase.from_("session_logs").insert([{
-                            "session_id": session_id,
-                            "event_type": "ai",
-                            "message": full_response
-                        }]).execute()
+                    history.append(("assistant", full_response))
+                    enqueue_log(session_id, "ai", full_response, {
+                        "intent": intent,
+                        "tool_used": tool_name if should_use else None
+                    })
             except Exception as e:
                 error_msg = f"Error: {str(e)}"
                 await websocket.send_text(error_msg)
-                print(f"Error generating response: {e}")
+                logger.error("Error generating response: %s", e)
     
     except WebSocketDisconnect:
-        print(f"[WEBSOCKET] ============================================")
-        print(f"[WEBSOCKET] Client disconnected for session: {session_id}")
-        print(f"[WEBSOCKET] Triggering post-session processing...")
-        print(f"[WEBSOCKET] ============================================")
-        # Post-session processing
-        await finalize_session(session_id)
-        print(f"[WEBSOCKET] Post-session processing complete")
+        logger.info("[WEBSOCKET] Client disconnected for session %s, scheduling post-session processing", session_id)
+        # Post-session processing runs in the background
+        schedule_finalize(session_id)
     except Exception as e:
-        print(f"[WEBSOCKET] ❌ Unexpected error in WebSocket: {e}")
-        import traceback
-        print(f"[WEBSOCKET] Traceback: {traceback.format_exc()}")
-        # Still try to finalize the session
-        print(f"[WEBSOCKET] Attempting to finalize session despite error...")
-        try:
-            await finalize_session(session_id)
-        except Exception as e2:
-            print(f"[WEBSOCKET] Failed to finalize: {e2}")
+        logger.error("[WEBSOCKET] ❌ Unexpected error in WebSocket: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG))
+        # Still finalize the session, in the background like a normal disconnect
+        logger.info("[WEBSOCKET] Scheduling session finalization despite error...")
+        schedule_finalize(session_id)
     
         
         
@@ -3,137 +3,234 @@ Supabase Connection & Schema Checker
 Run this to diagnose database issues
 """
 from dotenv import load_dotenv
+import atexit
+from functools import lru_cache
 import os
+import re
+import sys
 
-load_dotenv()
+# Base64url encoding of the {"alg":"HS256","typ":"JWT"} header every Supabase key starts with
+JWT_HS256_HEADER_PREFIX = "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9."
+# Supabase anon/service JWTs are well over this length; shorter ones were cut off
+MIN_JWT_KEY_LENGTH = 160
+# Newer Supabase API keys are opaque strings rather than JWTs
+NON_JWT_KEY_PREFIXES = ("sb_publishable_", "sb_secret_")
+
+# Per-request timeout for the checks, so an unreachable project fails fast
+SUPABASE_TIMEOUT_SECONDS = 10
+
+# Required sessions columns that a failed insert may name
+MISSING_COLUMN_RE = re.compile(r"'(status|start_time|user_id)'")
+
+# Output is collected and written in one go per section (before each network
+# call, so progress stays visible) instead of one write per line
+_OUT = []
+
+def log(line=""):
+    """Queue a line of output"""
+    _OUT.append(line)
+
+def flush_output():
+    """Write all queued lines at once"""
+    if _OUT:
+        sys.stdout.write("\n".join(_OUT) + "\n")
+        sys.stdout.flush()
+        _OUT.clear()
+
+# Also covers the exit(1) paths
+atexit.register(flush_output)
+
+# Only read .env when the variables are not already set in the environment
+if not (os.environ.get("SUPABASE_URL") and os.environ.get("SUPABASE_KEY")):
+    load_dotenv(override=False)
 
 # Check environment variables
-print("=" * 60)
-print("🔍 CHECKING ENVIRONMENT VARIABLES")
-print("=" * 60)
+log("=" * 60)
+log("🔍 CHECKING ENVIRONMENT VARIABLES")
+log("=" * 60)
 
 supabase_url = os.getenv("SUPABASE_URL")
 supabase_key = os.getenv("SUPABASE_KEY")
 
 if not supabase_url:
-    print("❌ SUPABASE_URL is not set in .env file")
+    log("❌ SUPABASE_URL is not set in .env file")
     exit(1)
 else:
-    print(f"✅ SUPABASE_URL: {supabase_url}")
+    log(f"✅ SUPABASE_URL: {supabase_url}")
 
 if not supabase_key:
-    print("❌ SUPABASE_KEY is not set in .env file")
+    log("❌ SUPABASE_KEY is not set in .env file")
     exit(1)
 else:
     # Show first 20 and last 10 characters for security
     masked_key = f"{supabase_key[:20]}...{supabase_key[-10:]}"
-    print(f"✅ SUPABASE_KEY: {masked_key}")
+    log(f"✅ SUPABASE_KEY: {masked_key}")
 
 # Check key type
-if "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9" in supabase_key:
-    print("✅ Key format looks correct (JWT)")
+if supabase_key.startswith(JWT_HS256_HEADER_PREFIX):
+    if len(supabase_key) <= MIN_JWT_KEY_LENGTH:
+        log(f"⚠️  Key is only {len(supabase_key)} characters - too short for a JWT, likely truncated in .env")
+    else:
+        log("✅ Key format looks correct (JWT)")
+elif supabase_key.startswith(NON_JWT_KEY_PREFIXES):
+    log("ℹ️  Key is a new-style Supabase API key (not a JWT) - length check skipped")
 else:
-    print("⚠️  Key format doesn't look like a JWT token")
+    log("⚠️  Key format doesn't look like a JWT token")
 
-print()
+log()
 
 # Try to connect
-print("=" * 60)
-print("🔌 TESTING SUPABASE CONNECTION")
-print("=" * 60)
-
+log("=" * 60)
+log("🔌 TESTING SUPABASE CONNECTION")
+log("=" * 60)
+
+@lru_cache(maxsize=1)
+def get_supabase():
+    """Create the Supabase client once; every check reuses it (and its HTTP session)"""
+    from supabase import create_client, ClientOptions
+    return create_client(
+        supabase_url,
+        supabase_key,
+        options=ClientOptions(postgrest_client_timeout=SUPABASE_TIMEOUT_SECONDS),
+    )
+
+flush_output()
 try:
-    from supabase import create_client
-    supabase = create_client(supabase_url, supabase_key)
-    print("✅ Supabase client created successfully")
+    supabase = get_supabase()
+    log("✅ Supabase client created successfully")
 except Exception as e:
-    print(f"❌ Failed to create Supabase client: {e}")
+    log(f"❌ Failed to create Supabase client: {e}")
     exit(1)
 
-print()
+log()
 
-# Check if tables exist
-print("=" * 60)
-print("📊 CHECKING DATABASE TABLES")
-print("=" * 60)
-
-# Test sessions table
-try:
-    result = supabase.from_("sessions").select("*").limit(1).execute()
-    print(f"✅ 'sessions' table exists")
-    print(f"   Total records: {len(result.data)}")
-    
-    # Check if we can see the schema
-    if result.data:
-        print(f"   Sample columns: {list(result.data[0].keys())}")
-except Exception as e:
-    print(f"❌ 'sessions' table error: {e}")
-    print("\n   💡 SOLUTION: Run the SQL schema in Supabase SQL Editor")
-    print("   👉 File: supabase_schema.sql")
-    print("   👉 Or see: DATABASE_SETUP.md")
-
-print()
-
-# Test session_logs table
+# Run every check below in a single round trip through diagnose_schema()
+# (database/schema.sql); probe one by one if the function is not installed
+diagnosis = None
+flush_output()
 try:
-    result = supabase.from_("session_logs").select("*").limit(1).execute()
-    print(f"✅ 'session_logs' table exists")
-    print(f"   Total records: {len(result.data)}")
+    diagnosis = supabase.rpc("diagnose_schema").execute().data
 except Exception as e:
-    print(f"❌ 'session_logs' table error: {e}")
-
-print()
+    log(f"ℹ️  diagnose_schema() not available, probing tables one by one: {e}")
+    log()
 
-# Test creating a session
-print("=" * 60)
-print("🧪 TESTING SESSION CREATION")
-print("=" * 60)
-
-import uuid
-from datetime import datetime
-
-test_session_id = str(uuid.uuid4())
-print(f"Test session ID: {test_session_id}")
-
-try:
-    result = supabase.from_("sessions").insert([{
-        "session_id": test_session_id,
-        "user_id": "test_user",
-        "status": "active",
-        "start_time": datetime.utcnow().isoformat()
-    }]).execute()
+# Check if tables exist
+log("=" * 60)
+log("📊 CHECKING DATABASE TABLES")
+log("=" * 60)
+
+if diagnosis is not None:
+    for table in ("sessions", "session_logs"):
+        if diagnosis[f"{table}_ok"]:
+            log(f"✅ '{table}' table exists")
+            log(f"   Has records: {'yes' if diagnosis[f'{table}_has_rows'] else 'no'}")
+        else:
+            log(f"❌ '{table}' table is missing")
+        log()
+    if not diagnosis["sessions_ok"]:
+        log("   💡 SOLUTION: Run the SQL schema in Supabase SQL Editor")
+        log("   👉 File: supabase_schema.sql")
+        log("   👉 Or see: DATABASE_SETUP.md")
+        log()
+else:
+    def count_rows(table, column):
+        """Count-only (HEAD) query: no row data is transferred"""
+        return supabase.from_(table).select(column, count="exact", head=True).execute()
     
-    print("✅ Successfully created test session!")
-    print(f"   Inserted record: {result.data}")
+    flush_output()
     
-    # Clean up - delete test session
-    supabase.from_("sessions").delete().eq("session_id", test_session_id).execute()
-    print("✅ Test session cleaned up")
+    # The two probes are independent: run them at the same time
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        sessions_probe = executor.submit(count_rows, "sessions", "session_id")
+        session_logs_probe = executor.submit(count_rows, "session_logs", "id")
     
-except Exception as e:
-    print(f"❌ Failed to create session: {e}")
+    # Test sessions table
+    try:
+        result = sessions_probe.result()
+        log(f"✅ 'sessions' table exists")
+        log(f"   Total records: {result.count}")
+    except Exception as e:
+        log(f"❌ 'sessions' table error: {e}")
+        log("\n   💡 SOLUTION: Run the SQL schema in Supabase SQL Editor")
+        log("   👉 File: supabase_schema.sql")
+        log("   👉 Or see: DATABASE_SETUP.md")
     
+    log()
+    
+    # Test session_logs table
+    try:
+        result = session_logs_probe.result()
+        log(f"✅ 'session_logs' table exists")
+        log(f"   Total records: {result.count}")
+    except Exception as e:
+        log(f"❌ 'session_logs' table error: {e}")
+    
+    log()
+
+# Test creating a session
+log("=" * 60)
+log("🧪 TESTING SESSION CREATION")
+log("=" * 60)
+
+def report_insert_error(error_msg):
+    """Explain a failed test insert"""
     # Check which column is missing
-    error_msg = str(e)
-    if "'status'" in error_msg:
-        print("\n   💡 Missing column: 'status'")
-    elif "'start_time'" in error_msg:
-        print("\n   💡 Missing column: 'start_time'")
-    elif "'user_id'" in error_msg:
-        print("\n   💡 Missing column: 'user_id'")
+    missing = MISSING_COLUMN_RE.search(error_msg)
+    if missing:
+        log(f"\n   💡 Missing column: '{missing.group(1)}'")
+    
+    log("\n   🔧 FIX: Your table schema is incomplete.")
+    log("   👉 Run the complete SQL from: supabase_schema.sql")
+    log("   👉 See guide: DATABASE_SETUP.md")
+
+if diagnosis is not None:
+    # diagnose_schema() inserts a test session and rolls the insert back
+    if diagnosis["insert_ok"]:
+        log("✅ Successfully created test session!")
+        log("✅ Test session rolled back (nothing was written)")
+    else:
+        error_msg = "; ".join(diagnosis["errors"])
+        log(f"❌ Failed to create session: {error_msg}")
+        report_insert_error(error_msg)
+else:
+    import uuid
+    from datetime import datetime, timezone
+    
+    # Postgres accepts the undashed hex form for UUID columns
+    test_session_id = uuid.uuid4().hex
+    # Timezone-aware, so Postgres does not have to assume the timestamp's zone
+    _NOW_ISO = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    log(f"Test session ID: {test_session_id}")
     
-    print("\n   🔧 FIX: Your table schema is incomplete.")
-    print("   👉 Run the complete SQL from: supabase_schema.sql")
-    print("   👉 See guide: DATABASE_SETUP.md")
-
-print()
-print("=" * 60)
-print("🎉 DIAGNOSIS COMPLETE")
-print("=" * 60)
-print()
-print("Next steps:")
-print("1. If you see ❌ errors above, follow the fixes suggested")
-print("2. Run supabase_schema.sql in Supabase SQL Editor")
-print("3. Run this script again to verify")
-print("4. Start your server: python -m uvicorn proj:app --port 8000")
-print()
+    flush_output()
+    try:
+        result = supabase.from_("sessions").insert([{
+            "session_id": test_session_id,
+            "user_id": "test_user",
+            "status": "active",
+            "start_time": _NOW_ISO
+        }]).execute()
+        
+        log("✅ Successfully created test session!")
+        log(f"   Inserted record: {result.data}")
+        
+        # Clean up - delete test session
+        supabase.from_("sessions").delete().eq("session_id", test_session_id).execute()
+        log("✅ Test session cleaned up")
+        
+    except Exception as e:
+        log(f"❌ Failed to create session: {e}")
+        report_insert_error(str(e))
+
+log()
+log("=" * 60)
+log("🎉 DIAGNOSIS COMPLETE")
+log("=" * 60)
+log()
+log("Next steps:")
+log("1. If you see ❌ errors above, follow the fixes suggested")
+log("2. Run supabase_schema.sql in Supabase SQL Editor")
+log("3. Run this script again to verify")
+log("4. Start your server: python -m uvicorn proj:app --port 8000")
+log()
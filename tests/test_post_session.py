@@ -3,104 +3,209 @@ Test script for Post-Session Processing
 Run this after starting the server to verify all functionality
 """
 
-import requests
-import time
+import asyncio
+import httpx
 import json
+import os
+import time
 
 BASE_URL = "http://localhost:8001"
 
-def test_health_check():
+# TEST_VERBOSE=1 prints full response payloads
+VERBOSE = os.getenv("TEST_VERBOSE") == "1"
+
+# Number of most recent sessions whose summaries are fetched
+SUMMARY_SAMPLE_SIZE = 3
+# Session ids per request to the bulk summaries endpoint (server maximum)
+BULK_SUMMARY_CHUNK_SIZE = 100
+
+# Summaries fetched during this run, by session id (reused by Test 5)
+fetched_summaries = {}
+
+# Summary responses are kept between runs and revalidated on every request
+# with their ETag / Last-Modified date (a 304 means the copy is still good)
+CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".test_cache.json")
+CACHE_MAX_ENTRIES = 256
+
+def load_response_cache():
+    """Load {session_id: {"etag", "last_modified", "body", "fetched_at"}} saved by earlier runs"""
+    try:
+        with open(CACHE_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_response_cache():
+    """Save the newest CACHE_MAX_ENTRIES cached responses for the next run"""
+    newest = sorted(response_cache.items(), key=lambda item: item[1]["fetched_at"])[-CACHE_MAX_ENTRIES:]
+    try:
+        with open(CACHE_FILE, "w", encoding="utf-8") as f:
+            json.dump(dict(newest), f)
+    except OSError as e:
+        print(f"⚠️ Could not save response cache: {e}")
+
+response_cache = load_response_cache()
+
+async def cached_get(client, session_id):
+    """Conditional GET of a session summary; returns (status, body, cache hit), with the cached body on a 304"""
+    entry = response_cache.get(session_id)
+    headers = {}
+    if entry and entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry and entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    response = await client.get(f"/api/session/{session_id}/summary", headers=headers)
+    if response.status_code == 304:
+        entry["fetched_at"] = time.time()
+        return 304, entry["body"], True
+    body = response.json()
+    if response.status_code == 200 and (response.headers.get("etag") or response.headers.get("last-modified")):
+        response_cache[session_id] = {
+            "etag": response.headers.get("etag"),
+            "last_modified": response.headers.get("last-modified"),
+            "body": body,
+            "fetched_at": time.time(),
+        }
+    return response.status_code, body, False
+
+async def test_health_check(client):
     """Test 1: Health Check"""
     print("\n🔍 Test 1: Health Check")
-    response = requests.get(f"{BASE_URL}/health")
+    response = await client.get("/health")
     print(f"Status: {response.status_code}")
-    print(f"Response: {json.dumps(response.json(), indent=2)}")
+    data = response.json()
+    if VERBOSE:
+        print(f"Response: {json.dumps(data, indent=2)}")
+    else:
+        print(f"Health: {data.get('status')}")
     assert response.status_code == 200
     print("✅ Health check passed")
 
-def test_list_sessions():
+async def test_list_sessions(client):
     """Test 2: List Sessions"""
     print("\n📋 Test 2: List Sessions")
-    response = requests.get(f"{BASE_URL}/api/sessions")
+    # Only the newest sessions are used below: request just that many
+    response = await client.get("/api/sessions", params={"limit": SUMMARY_SAMPLE_SIZE})
     print(f"Status: {response.status_code}")
     data = response.json()
-    print(f"Total sessions: {data.get('count', 0)}")
+    print(f"Sessions returned: {data.get('count', 0)}")
     if data.get('sessions'):
         print(f"Latest session: {data['sessions'][0]['session_id'][:8]}...")
     print("✅ List sessions passed")
     return data.get('sessions', [])
 
-def test_session_summary(session_id):
+async def test_session_summary(client, session_id):
     """Test 3: Get Session Summary"""
     print(f"\n📊 Test 3: Get Session Summary for {session_id[:8]}...")
-    response = requests.get(f"{BASE_URL}/api/session/{session_id}/summary")
-    print(f"Status: {response.status_code}")
-    if response.status_code == 200:
-        data = response.json()
-        print(f"Summary: {data.get('summary', 'N/A')[:100]}...")
+    status_code, data, cache_hit = await cached_get(client, session_id)
+    print(f"Status: {status_code}")
+    if cache_hit:
+        print("✅ unchanged (cache hit)")
+    if status_code == 200 or cache_hit:
+        fetched_summaries[session_id] = data
+        print(f"Summary: {(data.get('summary') or 'N/A')[:100]}...")
         print(f"Status: {data.get('status')}")
         print(f"Topics: {data.get('topics', [])}")
         print(f"Sentiment: {data.get('sentiment')}")
         print("✅ Session summary passed")
     else:
-        print(f"⚠️ Session summary returned: {response.json()}")
+        print(f"⚠️ Session summary returned: {data}")
 
-def test_regenerate_summary(session_id):
-    """Test 4: Regenerate Summary"""
-    print(f"\n🔄 Test 4: Regenerate Summary for {session_id[:8]}...")
-    response = requests.post(f"{BASE_URL}/api/session/{session_id}/regenerate-summary")
+async def test_bulk_summaries(client, session_ids):
+    """Test 4: Get Session Summaries in bulk"""
+    print(f"\n📚 Test 4: Get Session Summaries for {len(session_ids)} sessions")
+    summaries = {}
+    for start in range(0, len(session_ids), BULK_SUMMARY_CHUNK_SIZE):
+        chunk = session_ids[start:start + BULK_SUMMARY_CHUNK_SIZE]
+        response = await client.post("/api/sessions/summaries", json={"ids": chunk})
+        if response.status_code in (404, 405):
+            # Older server without the bulk endpoint: one request per session
+            # (skipping those already checked individually)
+            print("⚠️ Bulk endpoint not available, fetching summaries one by one")
+            await asyncio.gather(*(
+                test_session_summary(client, session_id)
+                for session_id in session_ids if session_id not in fetched_summaries
+            ))
+            return
+        print(f"Status: {response.status_code}")
+        data = response.json()
+        if "error" in data:
+            print(f"⚠️ Bulk summaries returned: {data}")
+            return
+        summaries.update(data['summaries'])
+    fetched_summaries.update(summaries)
+    for session_id in session_ids:
+        summary = summaries.get(session_id)
+        if summary:
+            print(f"{session_id[:8]}... [{summary.get('status')}] {(summary.get('summary') or 'N/A')[:80]}...")
+        else:
+            print(f"⚠️ {session_id[:8]}... not found")
+    print("✅ Bulk session summaries passed")
+
+async def test_regenerate_summary(client, session_id):
+    """Test 5: Regenerate Summary"""
+    print(f"\n🔄 Test 5: Regenerate Summary for {session_id[:8]}...")
+    response = await client.post(f"/api/session/{session_id}/regenerate-summary")
     print(f"Status: {response.status_code}")
     if response.status_code == 200:
         data = response.json()
         if data.get('success'):
-            print(f"New summary: {data['summary'].get('summary', 'N/A')[:100]}...")
+            new_summary = data['summary'].get('summary', 'N/A')
+            print(f"New summary: {new_summary[:100]}...")
+            previous = fetched_summaries.get(session_id)
+            if previous is not None:
+                changed = previous.get('summary') != new_summary
+                print(f"Compared to Tests 3-4: {'changed' if changed else 'unchanged'}")
             print("✅ Regenerate summary passed")
         else:
             print(f"⚠️ Regeneration failed: {data}")
     else:
         print(f"⚠️ Request failed: {response.json()}")
 
-def run_all_tests():
+async def run_all_tests():
     """Run all tests"""
     print("=" * 60)
     print("🚀 Starting Post-Session Processing Tests")
     print("=" * 60)
-    
-    try:
-        # Test 1: Health Check
-        test_health_check()
-        
-        # Test 2: List Sessions
-        sessions = test_list_sessions()
-        
-        # Test 3 & 4: If we have sessions, test their summaries
-        if sessions:
-            test_session = sessions[0]
-            session_id = test_session['session_id']
-            
-            test_session_summary(session_id)
-            
-            # Only regenerate if session is completed
-            if test_session.get('status') == 'completed':
-                test_regenerate_summary(session_id)
-        else:
-            print("\n⚠️ No sessions found. Create a chat session first!")
-            print("   1. Open http://localhost:8000")
-            print("   2. Send some messages")
-            print("   3. Close the browser tab")
-            print("   4. Wait a few seconds")
-            print("   5. Run this test again")
-        
-        print("\n" + "=" * 60)
-        print("✅ All tests completed!")
-        print("=" * 60)
-        
-    except requests.exceptions.ConnectionError:
-        print("\n❌ Error: Cannot connect to server")
-        print("   Make sure the server is running:")
-        print("   uvicorn proj:app --reload --port 8000")
-    except Exception as e:
-        print(f"\n❌ Test failed with error: {e}")
+
+    # One client (and connection pool) for every request; independent
+    # requests are sent concurrently
+    async with httpx.AsyncClient(base_url=BASE_URL, timeout=10) as client:
+        try:
+            # Test 1 & 2: Health Check and List Sessions
+            _, sessions = await asyncio.gather(test_health_check(client), test_list_sessions(client))
+
+            # Tests 3-5: If we have sessions, test their summaries
+            if sessions:
+                # The newest session through the single summary endpoint
+                # (conditional GET), then the whole sample in bulk
+                await test_session_summary(client, sessions[0]['session_id'])
+                await test_bulk_summaries(client, [session['session_id'] for session in sessions[:SUMMARY_SAMPLE_SIZE]])
+
+                # Only regenerate if session is completed
+                test_session = sessions[0]
+                if test_session.get('status') == 'completed':
+                    await test_regenerate_summary(client, test_session['session_id'])
+            else:
+                print("\n⚠️ No sessions found. Create a chat session first!")
+                print("   1. Open http://localhost:8000")
+                print("   2. Send some messages")
+                print("   3. Close the browser tab")
+                print("   4. Wait a few seconds")
+                print("   5. Run this test again")
+
+            print("\n" + "=" * 60)
+            print("✅ All tests completed!")
+            print("=" * 60)
+
+        except httpx.ConnectError:
+            print("\n❌ Error: Cannot connect to server")
+            print("   Make sure the server is running:")
+            print("   uvicorn proj:app --reload --port 8000")
+        except Exception as e:
+            print(f"\n❌ Test failed with error: {e}")
+        finally:
+            save_response_cache()
 
 if __name__ == "__main__":
-    run_all_tests()
+    asyncio.run(run_all_tests())